@@ -0,0 +1,296 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import re
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import asyncssh
+
+from connect import split_batch_output
+from metrics import metrics
+from reachability import tcp_probe_async
+from timing import timings
+
+# Matches a Cisco exec prompt such as "site-01-02#" or "core-sw(config)>"
+PROMPT_PATTERN = re.compile(r'([\w.\-()/:]+[>#])\s*$')
+
+# How long to wait for the prompt a device prints after login before nudging it with a newline
+PROMPT_NUDGE_SECONDS = 2
+
+
+class AsyncDeviceSession:
+    """Interactive CLI session over asyncssh, reading until the device prompt"""
+
+    def __init__(self, host: str, username: str, password: str, port: int = 22,
+                 timeout: float = 20, command_timeout: float = None, latencies: list = None):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.command_timeout = command_timeout or timeout
+        # (phase, seconds) of every successful connect and command, for adaptive timeouts
+        self.latencies = latencies if latencies is not None else []
+        self.prompt = None
+        self.last_error = None  # Why connect failed: timeout, unreachable, auth or error
+        self._conn = None
+        self._process = None
+        self.logger = logging.getLogger(__name__)
+
+    async def connect(self):
+        """Open the session, learn the prompt and disable paging"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with timings.span('ssh.connect'):
+            self._conn = await asyncssh.connect(
+                self.host, port=self.port, username=self.username, password=self.password,
+                known_hosts=None, connect_timeout=self.timeout
+            )
+            metrics.session_opened()
+            self._process = await self._conn.create_process(term_type='vt100', term_size=(511, 24))
+            # A newline sent up front would answer with a second prompt that can land after the
+            # next command's echo and shift every reply by one, so only send it if needed
+            try:
+                banner = await self._read_until_prompt(timeout=min(PROMPT_NUDGE_SECONDS, self.timeout))
+            except asyncio.TimeoutError:
+                self._process.stdin.write('\n')
+                banner = await self._read_until_prompt(timeout=self.timeout)
+            self.prompt = PROMPT_PATTERN.search(banner).group(1)
+        self.latencies.append(('connect', loop.time() - started))
+        await self.send_command('terminal length 0')
+
+    async def _read_until_prompt(self, echo: str = None, timeout: float = None, prompts: int = 1,
+                                 arrivals: list = None) -> str:
+        """Read until the prompt, and if echo is given only prompts following that echo count.
+
+        prompts is how many prompts must have arrived after the echo, one
+        per command when several were written at once. arrivals, if given,
+        gets the loop time each of those prompts was first seen.
+        """
+        buffer = ''
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.command_timeout)
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Timed out waiting for prompt from {self.host}")
+            chunk = await asyncio.wait_for(self._process.stdout.read(65536), remaining)
+            if not chunk:
+                raise ConnectionError(f"Session to {self.host} closed while reading")
+            buffer += chunk.replace('\r', '')
+            if self.prompt is None:
+                if PROMPT_PATTERN.search(buffer):
+                    return buffer
+                continue
+            if echo is not None:
+                # Skip any stale prompts that arrived before the device echoed the command
+                position = buffer.find(echo)
+                if position < 0:
+                    continue
+                buffer = buffer[position:]
+                echo = None
+            if arrivals is not None:
+                seen = min(buffer.count('\n' + self.prompt), prompts)
+                arrivals.extend([loop.time()] * (seen - len(arrivals)))
+            if buffer.rstrip().endswith(self.prompt) and (
+                    prompts == 1 or buffer.count('\n' + self.prompt) >= prompts):
+                return buffer
+
+    async def send_command(self, command: str) -> str:
+        """Run a command and return its output without the echo and trailing prompt"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with timings.span('ssh.command', command):
+            self._process.stdin.write(command + '\n')
+            output = await self._read_until_prompt(echo=command)
+        self.latencies.append(('command', loop.time() - started))
+        output = output.rstrip()[:-len(self.prompt)]
+        # Drop the echoed command line
+        return output.split('\n', 1)[1] if '\n' in output else ''
+
+    async def send_commands(self, commands: List[str]) -> Dict[str, str]:
+        """Write every command at once and split the replies on the prompts between them"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        arrivals = []
+        with timings.span('ssh.batch'):
+            self._process.stdin.write(''.join(command + '\n' for command in commands))
+            output = await self._read_until_prompt(echo=commands[0], timeout=self.command_timeout * len(commands),
+                                                   prompts=len(commands), arrivals=arrivals)
+        outputs = split_batch_output(output.rstrip(), commands, re.escape(self.prompt))
+        # Each reply is timed from the one before it, so per-command histograms and the adaptive
+        # timeouts see one command's latency, and a batch waits len(commands) x that timeout
+        for command, previous, arrived in zip(commands, [started] + arrivals, arrivals):
+            timings.observe('ssh.command', arrived - previous, command)
+            self.latencies.append(('command', arrived - previous))
+        return outputs
+
+    async def close(self):
+        if self._conn:
+            self._conn.close()
+            await self._conn.wait_closed()
+            self._conn = None
+            metrics.session_closed()
+
+
+class ReplayConnection:
+    """Stands in for DeviceConnection, serving output fetched by an async session"""
+
+    def __init__(self, hostname: str, outputs: Dict[str, str], device_type: str):
+        self.hostname = hostname
+        self.outputs = outputs
+        self.command_profile = device_type
+
+    def set_command_profile(self, device_type: str):
+        self.command_profile = device_type
+
+    def send_command(self, command: str, use_cache: bool = True) -> str:
+        if command not in self.outputs:
+            raise RuntimeError(f"Command '{command}' was not fetched for {self.hostname}")
+        return self.outputs[command]
+
+    def disconnect(self) -> None:
+        pass
+
+
+class AsyncCrawlEngine:
+    """Drives device visits as asyncio tasks instead of one thread per session.
+
+    Runs its own event loop on a background thread and shares the crawler's
+    frontier, database and parsing code, so only the SSH transport differs
+    from the threaded workers.
+    """
+
+    def __init__(self, crawler, max_sessions: int = 200, work_threads: int = 8):
+        self.crawler = crawler
+        self.max_sessions = max_sessions
+        self.logger = logging.getLogger(__name__)
+        self._thread = None
+        # Blocking frontier waits happen here so they never stall the event loop
+        self._dispatch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AsyncDispatch")
+        # Claims, database reads and writes and TextFSM parsing run here, so a lock wait or a large
+        # CDP table only holds up the visit it belongs to instead of every open session
+        self._work_pool = ThreadPoolExecutor(max_workers=work_threads, thread_name_prefix="AsyncWork")
+
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name="AsyncEngine", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Started async engine with up to {self.max_sessions} concurrent sessions")
+
+    def stop(self):
+        if self._thread:
+            self._thread.join()
+        self._dispatch_pool.shutdown(wait=False)
+        self._work_pool.shutdown(wait=False)
+
+    async def _blocking(self, function, *args):
+        """Run a blocking crawler call on the work pool, in the calling task's context like asyncio.to_thread"""
+        call = functools.partial(contextvars.copy_context().run, function, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._work_pool, call)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_sessions)
+        tasks = set()
+        while self.crawler.running:
+            entry = await loop.run_in_executor(self._dispatch_pool, self.crawler.frontier.get, 0.5)
+            if not entry:
+                continue
+            await slots.acquire()
+            task = asyncio.create_task(self._handle_entry(entry, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _handle_entry(self, entry: Dict, slots: asyncio.Semaphore):
+        hostname = entry['hostname']
+        try:
+            if not await self._blocking(self.crawler._claim_entry, entry, "AsyncEngine"):
+                return
+            try:
+                await self._process_device(entry)
+                await self._blocking(self.crawler._complete_entry, hostname)
+            except Exception as e:
+                self.logger.error(f"Error processing device {hostname}: {str(e)}")
+                self.logger.error(f"Traceback: {traceback.format_exc()}")
+                await self._blocking(self.crawler.db.release_device, hostname)
+        finally:
+            slots.release()
+
+    async def _connect(self, device) -> AsyncDeviceSession:
+        """Open a session trying the mgmt IP first, then the hostname, with each credential in turn"""
+        targets = [target for target in (device.mgmt_ip, device.hostname) if target]
+        for target in dict.fromkeys(targets):
+            if device.precheck_timeout:
+                with timings.span('tcp.precheck'):
+                    reason = await tcp_probe_async(target, device.port, device.precheck_timeout)
+                if reason is not None:
+                    self.logger.warning(f"Skipping {device.hostname} via {target}, TCP port {device.port} {reason}")
+                    metrics.connect_failed('unreachable')
+                    continue
+            candidates = device.credentials.candidates(device.hostname)
+            if not candidates:
+                self.logger.warning(f"{device.hostname} already rejected every credential, not logging in again")
+                break
+            for credential in candidates:
+                session = AsyncDeviceSession(target, credential['username'], credential['password'], port=device.port,
+                                             timeout=device.connect_timeout, command_timeout=device.command_timeout,
+                                             latencies=device.latencies)
+                try:
+                    await session.connect()
+                    device.credentials.succeeded(device.hostname, credential)
+                    device.credential = credential
+                    self.logger.info(f"Connected to {device.hostname} via {target} as {credential['name']}")
+                    return session
+                except (OSError, asyncssh.Error, asyncio.TimeoutError) as e:
+                    session.last_error = self._failure_reason(e)
+                    metrics.connect_failed(session.last_error)
+                    self.logger.warning(f"Failed to connect to {device.hostname} via {target}: {str(e)}")
+                    await session.close()
+                if session.last_error != 'auth':
+                    break  # Only a rejected login is worth retrying with the next credential
+                device.credentials.failed(device.hostname, credential)
+        return None
+
+    @staticmethod
+    def _failure_reason(error: Exception) -> str:
+        # TimeoutError is an OSError, so it has to be checked first
+        if isinstance(error, asyncio.TimeoutError):
+            return 'timeout'
+        if isinstance(error, asyncssh.PermissionDenied):
+            return 'auth'
+        if isinstance(error, OSError):
+            return 'unreachable'
+        return 'error'
+
+    async def _process_device(self, entry: Dict) -> List[Dict]:
+        hostname = entry['hostname']
+        self.logger.info(f"Processing device: {hostname} (depth {entry.get('depth', 0)}, via {entry.get('parent') or 'seed'})")
+        device = await self._blocking(self.crawler._build_device, entry, "AsyncEngine")
+        with timings.span('crawl.visit'):
+            with timings.span('device.connect'):
+                session = await self._connect(device)
+            if session is None:
+                self.logger.error(f"Failed to connect to {hostname}, skipping")
+                return []
+            try:
+                if self.crawler.batch_commands:
+                    outputs = await session.send_commands(list(device.VISIT_COMMANDS))
+                else:
+                    outputs = {command: await session.send_command(command) for command in device.VISIT_COMMANDS}
+
+                # Parsing and storage are the same code the threaded workers use
+                device.connection = ReplayConnection(hostname, outputs, device.device_type)
+                return await self._blocking(self.crawler._collect_device, device, entry)
+            except Exception as e:
+                self.logger.error(f"Error processing device {hostname}: {str(e)}")
+                self.logger.error(f"Traceback: {traceback.format_exc()}")
+                return []
+            finally:
+                await session.close()
+                await self._blocking(self.crawler._record_latencies, device, entry)
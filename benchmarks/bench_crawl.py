@@ -0,0 +1,313 @@
+"""End-to-end crawl benchmark against the simulated lab network.
+
+Runs NetworkCrawler over generated topologies for every combination of
+--sizes, --engines and --workers, and reports devices/sec, per-visit
+p50/p95/p99 split into connect/command/parse/db phases, peak RSS and
+SQLite write-lock waits as JSON. Each case gets a fresh simulator process
+and a fresh crawler process, so peak RSS is the crawler's alone.
+
+    python benchmarks/bench_crawl.py --sizes 100,1000,10000,50000 \\
+        --engines async,threads --workers 20,200 --output crawl.json
+"""
+import argparse
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PHASES = ('connect', 'command', 'parse', 'db')
+
+# Per-visit phase totals, and the phase being timed so nested calls are not counted twice
+_visit = contextvars.ContextVar('visit', default=None)
+_phase = contextvars.ContextVar('phase', default=None)
+
+
+class PhaseRecorder:
+    """Collects phase timings by wrapping crawler methods for the duration of a run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.visits = []
+        self.calls = {phase: [] for phase in PHASES}
+        self._patched = []
+
+    def _add(self, phase: str, elapsed: float):
+        visit = _visit.get()
+        if visit is not None:
+            visit[phase] += elapsed
+        with self._lock:
+            self.calls[phase].append(elapsed)
+
+    def _wrap(self, phase: str, func):
+        if phase == 'visit':
+            return self._wrap_visit(func)
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                if _phase.get() is not None:
+                    return await func(*args, **kwargs)
+                token = _phase.set(phase)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self._add(phase, time.perf_counter() - start)
+                    _phase.reset(token)
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if _phase.get() is not None:
+                return func(*args, **kwargs)
+            token = _phase.set(phase)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._add(phase, time.perf_counter() - start)
+                _phase.reset(token)
+        return timed
+
+    def _wrap_visit(self, func):
+        def finish(visit, start):
+            visit['total'] = time.perf_counter() - start
+            with self._lock:
+                self.visits.append(visit)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def visit_async(*args, **kwargs):
+                visit = dict.fromkeys(PHASES, 0.0)
+                token = _visit.set(visit)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    finish(visit, start)
+                    _visit.reset(token)
+            return visit_async
+
+        @functools.wraps(func)
+        def visit_sync(*args, **kwargs):
+            visit = dict.fromkeys(PHASES, 0.0)
+            token = _visit.set(visit)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                finish(visit, start)
+                _visit.reset(token)
+        return visit_sync
+
+    def patch(self, owner, name: str, phase: str):
+        original = getattr(owner, name)
+        setattr(owner, name, self._wrap(phase, original))
+        self._patched.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched.clear()
+
+    def report(self) -> dict:
+        phases = {phase: percentiles([visit[phase] for visit in self.visits]) for phase in PHASES}
+        phases['total'] = percentiles([visit['total'] for visit in self.visits])
+        return {
+            'visits': len(self.visits),
+            'visit_seconds': phases,
+            'call_seconds': {phase: percentiles(times) for phase, times in self.calls.items()}
+        }
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {'count': len(ordered), 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': ordered[-1]}
+
+
+def instrument(recorder: PhaseRecorder, engine: str):
+    """Wrap the methods that make up each phase of a device visit"""
+    from connect import DeviceConnection
+    from data import DeviceDatabase
+    from devices import NetworkDevice
+    from parser import CommandParser
+    import crawler
+
+    # Every public parse entry point, so parsing done outside TextFSM templates counts too
+    for name in dir(CommandParser):
+        if name.startswith('parse_'):
+            recorder.patch(CommandParser, name, 'parse')
+    for name in ('is_device_known', 'get_device_type', 'add_to_queue', 'add_device',
+                 'claim_device', 'mark_processed', 'release_device'):
+        recorder.patch(DeviceDatabase, name, 'db')
+    if engine == 'async':
+        from async_engine import AsyncCrawlEngine, AsyncDeviceSession
+        recorder.patch(AsyncCrawlEngine, '_process_device', 'visit')
+        recorder.patch(AsyncCrawlEngine, '_connect', 'connect')
+        recorder.patch(AsyncDeviceSession, 'send_command', 'command')
+        recorder.patch(AsyncDeviceSession, 'send_commands', 'command')
+    else:
+        recorder.patch(crawler.NetworkCrawler, '_process_device', 'visit')
+        recorder.patch(NetworkDevice, 'connect', 'connect')
+        recorder.patch(DeviceConnection, 'send_command', 'command')
+        # Visits fetch their commands in one batch, the calls that follow are served from cache
+        recorder.patch(DeviceConnection, 'send_commands', 'command')
+
+
+def serve_topology(args: dict, ready, stop):
+    """Simulator process: serve a generated topology until told to stop"""
+    import asyncio
+    from simulator import FakeNetwork, generate_topology
+
+    logging.basicConfig(level=logging.WARNING)
+    devices = generate_topology(args['size'], seed=args['seed'],
+                                auth_failure_rate=args['auth_failure_rate'],
+                                unreachable_rate=args['unreachable_rate'])
+    network = FakeNetwork(devices, port=args['port'], latency=args['latency'], jitter=args['jitter'])
+
+    async def run():
+        await network.start()
+        ready.set()
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        await network.stop()
+
+    asyncio.run(run())
+
+
+def run_crawl(args: dict, results):
+    """Crawler process: crawl the simulator and report timings"""
+    import crawler
+    from timing import timings
+
+    recorder = PhaseRecorder()
+    instrument(recorder, args['engine'])
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        # Configure logging before the crawler does, so it keeps crawler.log but skips the console
+        logging.basicConfig(level=args['log_level'], handlers=[logging.FileHandler('crawler.log')],
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        network_crawler = crawler.NetworkCrawler(
+            '127.1.0.1', 'admin', 'admin', max_workers=args['workers'],
+            db_path=os.path.join(tmp, 'bench.db'), engine=args['engine'], port=args['port']
+        )
+
+        start = time.perf_counter()
+        network_crawler.start()
+        timed_out = True
+        while time.perf_counter() - start < args['timeout']:
+            time.sleep(0.2)
+            status = network_crawler.db.get_queue_status()
+            if status['total'] and not status['pending'] and not len(network_crawler.frontier):
+                timed_out = False
+                break
+        elapsed = time.perf_counter() - start
+        network_crawler.stop()
+        status = network_crawler.get_status()
+        devices = network_crawler.db.get_known_hostnames()
+        lock_waits = network_crawler.db.lock_waits.snapshot()
+        network_crawler.db.close()
+
+    recorder.restore()
+    results.put({
+        'elapsed_seconds': elapsed,
+        'timed_out': timed_out,
+        'queue': status,
+        'devices_per_second': status['processed'] / elapsed if elapsed else 0,
+        'known_hostnames': len(devices),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'sqlite_lock_waits': lock_waits,
+        'spans': timings.snapshot(),
+        **recorder.report()
+    })
+
+
+def run_case(case: dict) -> dict:
+    context = multiprocessing.get_context('spawn')
+    ready, stop = context.Event(), context.Event()
+    simulator = context.Process(target=serve_topology, args=(case, ready, stop), daemon=True)
+    simulator.start()
+    if not ready.wait(600):
+        simulator.terminate()
+        raise RuntimeError(f"Simulator for {case['size']} devices did not start")
+
+    results = context.Queue()
+    crawl = context.Process(target=run_crawl, args=(case, results))
+    crawl.start()
+    try:
+        result = results.get(timeout=case['timeout'] + 300)
+    finally:
+        crawl.join(30)
+        stop.set()
+        simulator.join(30)
+    return {'case': case, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end crawl benchmark against the simulator")
+    parser.add_argument("--sizes", default="100,1000", help="Comma separated topology sizes")
+    parser.add_argument("--engines", default="async", help="Comma separated engines: async, threads")
+    parser.add_argument("--workers", default="50,200", help="Comma separated worker/session counts")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per command")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--auth-failure-rate", type=float, default=0.0)
+    parser.add_argument("--unreachable-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=1800, help="Give up on a case after this many seconds")
+    parser.add_argument("--log-level", default="WARNING", help="Crawler log level for crawler.log")
+    parser.add_argument("--port", type=int, default=2299)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    runs = []
+    for size in (int(value) for value in args.sizes.split(',')):
+        for engine in args.engines.split(','):
+            for workers in (int(value) for value in args.workers.split(',')):
+                case = {
+                    'size': size, 'engine': engine, 'workers': workers,
+                    'latency': args.latency, 'jitter': args.jitter,
+                    'auth_failure_rate': args.auth_failure_rate,
+                    'unreachable_rate': args.unreachable_rate,
+                    'timeout': args.timeout, 'port': args.port, 'seed': args.seed,
+                    'log_level': args.log_level
+                }
+                result = run_case(case)
+                runs.append(result)
+                total = result['visit_seconds']['total']
+                print(f"{size:>6} devices {engine:>7} x{workers:<4}: "
+                      f"{result['devices_per_second']:8.1f} devices/sec, "
+                      f"visit p50 {total['p50'] or 0:.3f}s p99 {total['p99'] or 0:.3f}s, "
+                      f"peak RSS {result['peak_rss_kb'] / 1024:.0f} MB"
+                      f"{' (timed out)' if result['timed_out'] else ''}", file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': runs
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Microbenchmark for DeviceDatabase throughput under concurrent workers.
+
+Compares the pooled DeviceDatabase against the previous connect-per-call
+pattern, replaying the queries a single device visit makes.
+
+    python benchmarks/bench_db.py --workers 32 --visits 2000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import DeviceDatabase
+
+NEIGHBORS_PER_VISIT = 8
+
+
+class ConnectPerCallDatabase:
+    """The old access pattern: a fresh sqlite3 connection for every call"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        DeviceDatabase(db_path).close()
+        # Put the file back into the default rollback journal the old code used
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('PRAGMA journal_mode = DELETE')
+
+    def _execute(self, sql, params=(), fetch=False):
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            result = cursor.fetchone() if fetch else None
+            conn.commit()
+        conn.close()
+        return result
+
+    def is_device_known(self, hostname):
+        return self._execute('SELECT 1 FROM devices WHERE hostname = ?', (hostname,), True) is not None
+
+    def add_to_queue(self, hostname):
+        if not self._execute('SELECT 1 FROM crawl_queue WHERE hostname = ?', (hostname,), True):
+            self._execute('INSERT OR IGNORE INTO crawl_queue (hostname, processed) VALUES (?, 0)', (hostname,))
+
+    def claim_device(self, hostname, owner):
+        self._execute('UPDATE crawl_queue SET processing = 1 WHERE hostname = ?', (hostname,))
+        return True
+
+    def add_device(self, device_info):
+        self._execute('INSERT OR REPLACE INTO devices (hostname, ip, platform) VALUES (?, ?, ?)',
+                      (device_info['hostname'], device_info['ip'], device_info['platform']))
+
+    def mark_processed(self, hostname):
+        self._execute('UPDATE crawl_queue SET processed = 1, processing = 0 WHERE hostname = ?', (hostname,))
+
+    def get_queue_status(self):
+        return {
+            'total': self._execute('SELECT COUNT(*) FROM crawl_queue', (), True)[0],
+            'pending': self._execute('SELECT COUNT(*) FROM crawl_queue WHERE processed = 0', (), True)[0],
+            'processed': self._execute('SELECT COUNT(*) FROM crawl_queue WHERE processed = 1', (), True)[0],
+        }
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def visit(db, worker: int, index: int) -> int:
+    """Replay the database calls of one device visit, returns the op count"""
+    hostname = f"site-{worker:02d}-{index:05d}"
+    db.claim_device(hostname, f"Worker-{worker}")
+    ops = 1
+    for n in range(NEIGHBORS_PER_VISIT):
+        neighbor = f"site-{worker:02d}-{index:05d}-n{n}"
+        if not db.is_device_known(neighbor):
+            db.add_to_queue(neighbor)
+            ops += 1
+        ops += 1
+    db.add_device({'hostname': hostname, 'ip': '10.0.0.1', 'platform': 'C9300'})
+    db.mark_processed(hostname)
+    db.get_queue_status()
+    return ops + 3
+
+
+def run(db, workers: int, visits: int) -> float:
+    """Run visits spread over worker threads, returns ops/sec"""
+    counts = [0] * workers
+    per_worker = visits // workers
+
+    def work(worker):
+        for index in range(per_worker):
+            counts[worker] += visit(db, worker, index)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.flush()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DeviceDatabase microbenchmark")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--visits", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, factory in (('connect-per-call', ConnectPerCallDatabase), ('pooled', DeviceDatabase)):
+            db = factory(os.path.join(tmp, f"{name}.db"))
+            results[name] = run(db, args.workers, args.visits)
+            db.close()
+            print(f"{name:>18}: {results[name]:10.0f} ops/sec "
+                  f"({args.workers} workers, {args.visits} visits)")
+
+    print(f"{'speedup':>18}: {results['pooled'] / results['connect-per-call']:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark for TextFSM parsing of 'show cdp neighbors detail' output.
+
+Parses a corpus of captured outputs (one file per device, --corpus DIR) or a
+generated corpus, once with a freshly compiled template per parse the way
+CommandParser used to, and once through the cached CommandParser.
+
+    python benchmarks/bench_parser.py --corpus captures/cdp --rounds 20
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from textfsm import TextFSM
+from parser import CommandParser
+
+NEIGHBOR_ENTRY = """-------------------------
+Device ID: {name}.example.com({serial})
+Entry address(es):
+  IP address: {ip}
+Platform: cisco {platform},  Capabilities: {capabilities}
+Interface: GigabitEthernet1/0/{local},  Port ID (outgoing port): {remote}
+Holdtime : 150 sec
+
+Version :
+Cisco IOS Software, Catalyst L3 Switch Software (CAT9K_IOSXE), Version 17.3.4, RELEASE SOFTWARE (fc3)
+Technical Support: http://www.cisco.com/techsupport
+
+advertisement version: 2
+"""
+
+PLATFORMS = (
+    ('C9300-48P', 'Switch IGMP'),
+    ('C9500-24Y4C', 'Router Switch IGMP'),
+    ('IP Phone 8845', 'Host Phone Two-port Mac Relay'),
+    ('AIR-AP2802I-B-K9', 'Trans-Bridge Source-Route-Bridge IGMP'),
+)
+
+
+def generate_corpus(devices: int, neighbors: int, seed: int = 1) -> list:
+    """Build show cdp neighbors detail outputs for a synthetic set of devices"""
+    rng = random.Random(seed)
+    corpus = []
+    for device in range(devices):
+        entries = []
+        for n in range(rng.randint(1, neighbors)):
+            platform, capabilities = rng.choice(PLATFORMS)
+            entries.append(NEIGHBOR_ENTRY.format(
+                name=f"site-{device % 100:02d}-{n:02d}",
+                serial=f"FOC{rng.randint(1000, 9999)}X{n:03d}",
+                ip=f"10.{device % 250}.{n // 250}.{n % 250 + 1}",
+                platform=platform,
+                capabilities=capabilities,
+                local=n + 1,
+                remote=f"GigabitEthernet0/{n % 48}",
+            ))
+        corpus.append("\n".join(entries))
+    return corpus
+
+
+def load_corpus(path: str) -> list:
+    corpus = []
+    for filename in sorted(glob.glob(os.path.join(path, '*'))):
+        with open(filename) as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def parse_uncached(output: str, template_dir: str) -> list:
+    """The previous behaviour: resolve, open and compile the template on every parse"""
+    template_path = os.path.join(template_dir, 'show_cdp_neighbors_detail.template')
+    os.path.exists(template_path)
+    with open(template_path) as template_file:
+        template = TextFSM(template_file)
+        parsed = template.ParseText(output)
+    return [dict(zip(template.header, row)) for row in parsed]
+
+
+def measure(name: str, parse, corpus: list, rounds: int) -> float:
+    rows = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for output in corpus:
+            rows += len(parse(output))
+    elapsed = time.perf_counter() - start
+    rate = rounds * len(corpus) / elapsed
+    print(f"{name:>10}: {rate:10.0f} parses/sec ({rows} neighbours parsed)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CDP parsing benchmark")
+    parser.add_argument("--corpus", help="Directory of captured show cdp neighbors detail outputs")
+    parser.add_argument("--devices", type=int, default=200, help="Generated corpus size")
+    parser.add_argument("--neighbors", type=int, default=12, help="Max neighbours per generated output")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.devices, args.neighbors)
+    template_dir = os.path.join(ROOT, 'templates')
+    command_parser = CommandParser(template_dir=template_dir)
+
+    uncached = measure('uncached', lambda output: parse_uncached(output, template_dir), corpus, args.rounds)
+    cached = measure('cached', lambda output: command_parser._parse_with_template(
+        output, 'show_cdp_neighbors_detail'), corpus, args.rounds)
+    print(f"{'speedup':>10}: {cached / uncached:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
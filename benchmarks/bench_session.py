@@ -0,0 +1,125 @@
+"""Per-command latency of the fast and conservative netmiko session profiles.
+
+Opens sessions to one simulated device of each platform under every
+profile, runs the commands a crawl visit runs, and reports connect and
+per-command p50/p95/max as JSON, along with the time to send all of them
+as one pipelined batch. --latency sets how long the simulated
+device takes to answer each command, so a profile's overhead on top of
+the device itself is the difference.
+
+    python benchmarks/bench_session.py --sessions 20 --latency 0.1
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import connect
+from connect import DeviceConnection
+from devices import NetworkDevice
+from simulator import FakeNetwork, generate_topology
+
+# Simulator flavour -> netmiko device_type
+PLATFORMS = {'nxos': 'cisco_nxos', 'xe': 'cisco_xe', 'ios': 'cisco_ios'}
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        'max': ordered[-1]
+    }
+
+
+def run_sessions(address: str, device_type: str, profile: str, sessions: int, port: int) -> dict:
+    """Open sessions to one device, timing the login and each visit command"""
+    connects = []
+    commands = {command: [] for command in NetworkDevice.VISIT_COMMANDS}
+    batches = []
+    failures = 0
+    for _ in range(sessions):
+        # A fallback in an earlier session would otherwise pin the host to conservative
+        connect._conservative_hosts.discard(address)
+        connection = DeviceConnection(address, 'admin', 'admin', device_type, port=port, session_profile=profile)
+        start = time.perf_counter()
+        if not connection.connect():
+            failures += 1
+            continue
+        connects.append(time.perf_counter() - start)
+        try:
+            for command in NetworkDevice.VISIT_COMMANDS:
+                start = time.perf_counter()
+                connection.send_command(command, use_cache=False)
+                commands[command].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            connection.send_commands(list(NetworkDevice.VISIT_COMMANDS), use_cache=False)
+            batches.append(time.perf_counter() - start)
+        finally:
+            connection.disconnect()
+    return {
+        'profile_used': connection.session_profile,
+        'failures': failures,
+        'connect_seconds': percentiles(connects),
+        'command_seconds': {command: percentiles(times) for command, times in commands.items()},
+        'batch_seconds': percentiles(batches)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare netmiko session profiles against the simulator")
+    parser.add_argument("--profiles", default="fast,conservative", help="Comma separated session profiles")
+    parser.add_argument("--sessions", type=int, default=10, help="Sessions per device and profile")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per command")
+    parser.add_argument("--port", type=int, default=2297)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    devices = generate_topology(60)
+    # The first device of each flavour, cores, distribution and access switches
+    targets = {}
+    for device in devices.values():
+        targets.setdefault(device.flavour, device)
+
+    network = FakeNetwork(devices, port=args.port, latency=args.latency)
+    network.start_in_thread()
+    runs = []
+    try:
+        for profile in args.profiles.split(','):
+            for flavour, device in targets.items():
+                result = run_sessions(device.address, PLATFORMS[flavour], profile, args.sessions, args.port)
+                runs.append({'profile': profile, 'device_type': PLATFORMS[flavour], **result})
+                timings = ', '.join(f"{command} p50 {stats['p50'] or 0:.3f}s"
+                                    for command, stats in result['command_seconds'].items())
+                print(f"{profile:>12} {PLATFORMS[flavour]:>10}: connect p50 "
+                      f"{result['connect_seconds']['p50'] or 0:.3f}s, {timings}, "
+                      f"batch p50 {result['batch_seconds']['p50'] or 0:.3f}s"
+                      f"{' (fell back to conservative)' if result['profile_used'] != profile else ''}",
+                      file=sys.stderr)
+    finally:
+        network.stop_thread()
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency': args.latency,
+        'runs': runs
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,89 @@
-from typing import Optional
+from typing import Dict, List, Optional
 from netmiko import ConnectHandler
-from netmiko.exceptions import NetMikoTimeoutException, NetMikoAuthenticationException
+from netmiko.exceptions import NetMikoTimeoutException, NetMikoAuthenticationException, ReadTimeout
 import logging
+import re
+import time
 import traceback
+from timing import timings
+from metrics import metrics
+
+# netmiko settings per session profile and platform. The conservative profile
+# multiplies every sleep, the fast one lets netmiko scale its delays down to 0.1
+# and ends each read at the prompt instead of on a timer.
+SESSION_PROFILES = {
+    'conservative': {
+        'cisco_nxos': {'fast_cli': False, 'global_delay_factor': 3, 'read_timeout_override': 30},
+        'cisco_xe': {'fast_cli': False, 'global_delay_factor': 2, 'read_timeout_override': 25},
+        'cisco_ios': {'fast_cli': False, 'global_delay_factor': 2, 'read_timeout_override': 20},
+    },
+    'fast': {
+        'cisco_nxos': {'fast_cli': True, 'global_delay_factor': 1},
+        'cisco_xe': {'fast_cli': True, 'global_delay_factor': 1},
+        'cisco_ios': {'fast_cli': True, 'global_delay_factor': 1},
+    },
+}
+
+# What ends the prompt on each platform, the fast profile reads until <base prompt>...<terminator>
+PROMPT_TERMINATORS = {
+    'cisco_nxos': '#',
+    'cisco_xe': '[>#]',
+    'cisco_ios': '[>#]',
+}
+
+# Upper bound for a fast-profile read, it normally ends as soon as the prompt arrives
+FAST_READ_TIMEOUT = 20
+
+# Gap between reads while waiting for the replies to a batch of commands
+BATCH_LOOP_DELAY = 0.01
+
+# Hosts that failed under the fast profile, later sessions go straight to the conservative one
+_conservative_hosts = set()
+
+
+def split_batch_output(output: str, commands: List[str], prompt: str) -> Dict[str, str]:
+    """Split the replies to pipelined commands on the prompts between them.
+
+    output runs from the first command's echo to the prompt after the last
+    reply, prompt is a regex for the device prompt. Each reply is returned
+    without its echo line and the prompt that ended it.
+    """
+    segments = re.split(rf"(?:^|\n){prompt}", output)
+    if len(segments) != len(commands) + 1:
+        raise ValueError(f"Expected {len(commands)} prompts in batched output, found {len(segments) - 1}")
+    outputs = {}
+    for command, segment in zip(commands, segments):
+        echo, _, reply = segment.partition('\n')
+        if command not in echo:
+            raise ValueError(f"Batched output out of step, expected the echo of '{command}' but got '{echo.strip()}'")
+        outputs[command] = reply
+    return outputs
+
 
 class DeviceConnection:
-    def __init__(self, hostname: str, username: str, password: str, device_type: str):
+    def __init__(self, hostname: str, username: str, password: str, device_type: str, port: int = 22,
+                 session_profile: str = 'fast', connect_timeout: float = 20, read_timeout: float = None,
+                 latencies: list = None):
         self.hostname = hostname
+        self.command_profile = device_type  # Platform used for prompt handling, may change mid-session
+        # 'fast' or 'conservative', a fast session that fails is retried as conservative
+        self.session_profile = 'conservative' if hostname in _conservative_hosts else session_profile
         self.connection_params = {
             'device_type': device_type,
             'host': hostname,
+            'port': port,
             'username': username,
             'password': password,
-            'timeout': 20,  # Connection timeout in seconds
             'session_log': None,
-            'fast_cli': False,  # Disable fast_cli for more reliable connections
-            'global_delay_factor': 2,  # Increase delay factor for more reliable connections
         }
-        
-        # Add platform-specific parameters
-        if device_type == 'cisco_nxos':
-            self.connection_params.update({
-                'global_delay_factor': 3,  # NX-OS often needs more time
-                'read_timeout_override': 30,  # Increase read timeout for NX-OS
-                'expect_string': r'#\s*$',  # NX-OS prompt pattern
-                'auto_connect': False,  # Don't auto connect, we'll do it manually
-            })
-        elif device_type == 'cisco_xe':
-            self.connection_params.update({
-                'global_delay_factor': 2,
-                'read_timeout_override': 25,
-                'expect_string': r'#\s*$',  # IOS-XE prompt pattern
-            })
-        else:  # Default to IOS parameters
-            self.connection_params.update({
-                'global_delay_factor': 2,
-                'read_timeout_override': 20,
-            })
+        self.connect_timeout = connect_timeout  # Seconds for each login stage, see _session_params
+        self.read_timeout = read_timeout  # Per-command timeout, None keeps the session profile's
+        # (phase, seconds) of every successful connect and command, for adaptive timeouts
+        self.latencies = latencies if latencies is not None else []
             
         self.connection: Optional[ConnectHandler] = None
+        self.last_error = None  # Why the last connect failed: timeout, unreachable, auth, prompt or error
+        self._output_cache = {}  # Command output for this session, keyed by command
         
         # Configure logging
         self.logger = logging.getLogger(__name__)
@@ -47,66 +92,203 @@ class DeviceConnection:
     # Returns true if connects, false if something went wrong
     # throws no exceptions
     def connect(self) -> bool:
-        """Establish SSH connection to the device"""
-        self.logger.info(f"Attempting to connect to {self.hostname}")
+        """Establish SSH connection to the device, retrying a failed fast session as conservative"""
+        if self._open_session():
+            return True
+        # Only a login that never showed a usable prompt can be rescued by slower reads, dead hosts,
+        # connect timeouts and rejected logins would fail again after the same wait
+        if self.session_profile == 'fast' and self.last_error == 'prompt':
+            self._fall_back("no usable prompt after login")
+            # The host already held one login without a prompt, so the retry's login reads are capped
+            return self._open_session(login_read_timeout=self.connect_timeout)
+        return False
+
+    def _session_params(self) -> dict:
+        """ConnectHandler arguments for the current session profile"""
+        platforms = SESSION_PROFILES[self.session_profile]
+        params = {**self.connection_params, **platforms.get(self.connection_params['device_type'], platforms['cisco_ios'])}
+        if self.read_timeout is not None and 'read_timeout_override' in params:
+            params['read_timeout_override'] = self.read_timeout
+        # netmiko 4 times the TCP connect, SSH banner and auth reply separately, the conservative
+        # profile gives each of them as much longer as it makes its delays
+        login_timeout = self.connect_timeout * params['global_delay_factor']
+        params.update(conn_timeout=login_timeout, banner_timeout=login_timeout, auth_timeout=login_timeout)
+        return params
+
+    def _fall_back(self, reason: str):
+        """Switch this host to the conservative profile for this and later sessions"""
+        self.logger.warning(f"Fast session profile failed for {self.hostname}: {reason}, using the conservative profile")
+        self.session_profile = 'conservative'
+        _conservative_hosts.add(self.hostname)
+        metrics.session_fallback()
+
+    def _open_session(self, login_read_timeout: float = None) -> bool:
+        """Log in with the current profile, login_read_timeout caps each read until the session is set up"""
+        self.logger.info(f"Attempting to connect to {self.hostname} with the {self.session_profile} profile")
+        params = self._session_params()
+        read_timeout = params.get('read_timeout_override')
+        if login_read_timeout is not None:
+            params['read_timeout_override'] = min(read_timeout or login_read_timeout, login_read_timeout)
         try:
-            self.connection = ConnectHandler(**self.connection_params)
+            start = time.perf_counter()
+            with timings.span('ssh.connect'):
+                self.connection = ConnectHandler(**params)
+            # netmiko reads the override on every call, commands get the profile's value back
+            self.connection.read_timeout_override = read_timeout
+            self.latencies.append(('connect', time.perf_counter() - start))
+            metrics.session_opened()
             
-            # Handle platform-specific connection setup
-            if self.connection_params['device_type'] == 'cisco_nxos':
-                self.logger.debug("Handling NX-OS specific connection setup")
-                # Send a newline to get the prompt
-                self.connection.write_channel("\n")
-                # Wait for the prompt
-                self.connection.find_prompt()
-                # Disable paging
-                self.connection.send_command("terminal length 0", expect_string=r'#\s*$')
-            elif self.connection_params['device_type'] == 'cisco_xe':
-                self.logger.debug("Handling IOS-XE specific connection setup")
-                # Disable paging
-                self.connection.send_command("terminal length 0", expect_string=r'#\s*$')
-            else:  # Default to IOS setup
-                self.logger.debug("Handling IOS specific connection setup")
-                # Disable paging
-                self.connection.send_command("terminal length 0")
+            # netmiko's own session preparation already turned paging off, the conservative profile repeats it
+            if self.session_profile == 'conservative':
+                with timings.span('ssh.command', 'terminal length 0'):
+                    self._disable_paging()
             
             self.logger.info(f"Successfully connected to {self.hostname}")
             return True
-        except NetMikoTimeoutException:
+        except NetMikoTimeoutException as e:
+            if self._prompt_failed(e):
+                return self._no_prompt(e)
+            # netmiko reports refused and unresolvable hosts as timeouts too
+            unreachable = 'TCP connection' in str(e) or 'DNS failure' in str(e)
+            self._connect_failed('unreachable' if unreachable else 'timeout')
             self.logger.error(f"Timeout connecting to {self.hostname}")
             return False
-        except NetMikoAuthenticationException:
+        except NetMikoAuthenticationException as e:
+            # paramiko raises its auth_timeout as an authentication failure, but the password was never judged
+            if 'Authentication timeout' in str(e):
+                self._connect_failed('timeout')
+                self.logger.error(f"Timeout waiting for {self.hostname} to answer the login")
+                return False
+            self._connect_failed('auth')
             self.logger.error(f"Authentication failed for {self.hostname}")
             return False
         except Exception as e:
+            if self._prompt_failed(e):
+                return self._no_prompt(e)
+            self._connect_failed('error')
             self.logger.error(f"Error connecting to {self.hostname}: {str(e)}")
             self.logger.error(f"Traceback: {traceback.format_exc()}")
+            # Don't leave a half set up session open
+            self.disconnect()
             return False
 
+    @staticmethod
+    def _prompt_failed(error: Exception) -> bool:
+        """True if the login was accepted but reading the prompt or setting up paging failed"""
+        if isinstance(error, ReadTimeout):
+            return True
+        # netmiko's post-login channel check and find_prompt
+        return 'Timed out waiting for data' in str(error) or 'Unable to find prompt' in str(error)
+
+    def _no_prompt(self, error: Exception) -> bool:
+        self._connect_failed('prompt')
+        self.logger.error(f"Logged in to {self.hostname} but no usable prompt appeared: {str(error).strip()}")
+        self.disconnect()
+        return False
+
+    def _connect_failed(self, reason: str):
+        self.last_error = reason
+        metrics.connect_failed(reason)
+
+    def _disable_paging(self):
+        """Run the platform-specific session setup"""
+        if self.connection_params['device_type'] == 'cisco_nxos':
+            self.logger.debug("Handling NX-OS specific connection setup")
+            # Send a newline to get the prompt
+            self.connection.write_channel("\n")
+            # Wait for the prompt
+            self.connection.find_prompt()
+            # Disable paging
+            self.connection.send_command("terminal length 0", expect_string=r'#\s*$')
+        elif self.connection_params['device_type'] == 'cisco_xe':
+            self.logger.debug("Handling IOS-XE specific connection setup")
+            # Disable paging
+            self.connection.send_command("terminal length 0", expect_string=r'#\s*$')
+        else:  # Default to IOS setup
+            self.logger.debug("Handling IOS specific connection setup")
+            # Disable paging
+            self.connection.send_command("terminal length 0")
+
     def disconnect(self) -> None:
         """Close the SSH connection"""
         if self.connection:
             self.logger.debug(f"Disconnecting from {self.hostname}")
             self.connection.disconnect()
             self.connection = None
+            self._output_cache.clear()
+            metrics.session_closed()
             self.logger.info(f"Disconnected from {self.hostname}")
 
-    def send_command(self, command: str) -> str:
-        """Send a command to the device and return the output"""
+    def set_command_profile(self, device_type: str):
+        """Switch prompt handling to another platform without reconnecting"""
+        if device_type != self.command_profile:
+            self.logger.info(f"Switching {self.hostname} command profile from {self.command_profile} to {device_type}")
+            self.command_profile = device_type
+
+    def send_command(self, command: str, use_cache: bool = True) -> str:
+        """Send a command to the device, repeats within a session are served from cache"""
         if not self.connection:
             self.logger.error(f"Not connected to device {self.hostname}")
             raise RuntimeError("Not connected to device")
+        
+        if use_cache and command in self._output_cache:
+            self.logger.debug(f"Serving '{command}' for {self.hostname} from session cache")
+            return self._output_cache[command]
             
         self.logger.debug(f"Sending command to {self.hostname}: {command}")
         try:
+            try:
+                output = self._send(command)
+            except ReadTimeout:
+                if self.session_profile != 'fast':
+                    raise
+                # The prompt never matched, redo the command on a conservative session
+                self._fall_back(f"no prompt after '{command}'")
+                self.disconnect()
+                if not self._open_session():
+                    raise
+                output = self._send(command)
+                
+            if "Invalid input" in output or "Incomplete command" in output:
+                self.logger.error(f"Invalid command for {self.hostname}: {command}")
+                raise ValueError(f"Invalid command: {command}")
+            self.logger.debug(f"Command output length: {len(output)} characters")
+            if use_cache:
+                self._output_cache[command] = output
+            return output
+        except Exception as e:
+            self.logger.error(f"Error sending command '{command}' to {self.hostname}: {str(e)}")
+            self.logger.error(f"Traceback: {traceback.format_exc()}")
+            raise
+
+    def _prompt(self) -> str:
+        """Regex for this session's prompt, the hostname netmiko found plus the platform's terminator"""
+        terminator = PROMPT_TERMINATORS.get(self.command_profile, PROMPT_TERMINATORS['cisco_ios'])
+        return rf"{re.escape(self.connection.base_prompt)}(?:\([^)\n]*\))?{terminator}"
+
+    def _prompt_pattern(self) -> str:
+        """Regex for the prompt that ends a fast-profile read"""
+        # Anchored to a line start, so output lines that merely begin with the hostname do not end the read
+        return rf"(?:^|\n){self._prompt()}\s*$"
+
+    def _send(self, command: str) -> str:
+        """Run one command with the read strategy of the session and platform profiles"""
+        start = time.perf_counter()
+        with timings.span('ssh.command', command):
+            if self.session_profile == 'fast':
+                output = self.connection.send_command(
+                    command,
+                    expect_string=self._prompt_pattern(),
+                    read_timeout=self.read_timeout or FAST_READ_TIMEOUT
+                )
             # Handle platform-specific command sending
-            if self.connection_params['device_type'] == 'cisco_nxos':
+            elif self.command_profile == 'cisco_nxos':
                 output = self.connection.send_command(
                     command,
                     expect_string=r'#\s*$',
                     read_timeout=30
                 )
-            elif self.connection_params['device_type'] == 'cisco_xe':
+            elif self.command_profile == 'cisco_xe':
                 output = self.connection.send_command(
                     command,
                     expect_string=r'#\s*$',
@@ -114,16 +296,79 @@ class DeviceConnection:
                 )
             else:  # Default to IOS command sending
                 output = self.connection.send_command(command)
-                
-            if "Invalid input" in output or "Incomplete command" in output:
-                self.logger.error(f"Invalid command for {self.hostname}: {command}")
-                raise ValueError(f"Invalid command: {command}")
-            self.logger.debug(f"Command output length: {len(output)} characters")
-            return output
-        except Exception as e:
-            self.logger.error(f"Error sending command '{command}' to {self.hostname}: {str(e)}")
-            self.logger.error(f"Traceback: {traceback.format_exc()}")
-            raise
+        self.latencies.append(('command', time.perf_counter() - start))
+        return output
+
+    def send_commands(self, commands: List[str], use_cache: bool = True) -> Dict[str, str]:
+        """Send several commands in one channel write and return their output keyed by command.
+
+        The fast profile pipelines the commands and splits the combined
+        replies on the prompts between them, so a batch costs one round trip
+        instead of one per command. If the replies never line up the host
+        falls back to the conservative profile, which sends one at a time.
+        """
+        if not self.connection:
+            self.logger.error(f"Not connected to device {self.hostname}")
+            raise RuntimeError("Not connected to device")
+
+        outputs = {command: self._output_cache[command] for command in commands
+                   if use_cache and command in self._output_cache}
+        pending = [command for command in dict.fromkeys(commands) if command not in outputs]
+        if len(pending) > 1 and self.session_profile == 'fast':
+            self.logger.debug(f"Sending {len(pending)} commands to {self.hostname} in one batch")
+            try:
+                batch = self._send_batch(pending)
+            except (ReadTimeout, ValueError) as e:
+                # Replies that did not line up leave the channel in an unknown state, start over
+                self._fall_back(f"batched commands failed ({str(e)})")
+                self.disconnect()
+                if not self._open_session():
+                    raise
+            else:
+                for command, output in batch.items():
+                    if "Invalid input" in output or "Incomplete command" in output:
+                        self.logger.error(f"Invalid command for {self.hostname}: {command}")
+                        raise ValueError(f"Invalid command: {command}")
+                    if use_cache:
+                        self._output_cache[command] = output
+                outputs.update(batch)
+                pending = []
+
+        for command in pending:
+            outputs[command] = self.send_command(command, use_cache=use_cache)
+        return outputs
+
+    def _send_batch(self, commands: List[str]) -> Dict[str, str]:
+        """Write every command at once, then read until the prompt after the last reply"""
+        prompt = self._prompt()
+        done = re.compile(rf"(?:^|\n){prompt}")
+        end = re.compile(rf"{prompt}\s*$")
+        read_timeout = (self.read_timeout or FAST_READ_TIMEOUT) * len(commands)
+        start = time.perf_counter()
+        arrivals = []  # When the prompt ending each reply arrived
+        with timings.span('ssh.batch'):
+            self.connection.write_channel(''.join(command + self.connection.RETURN for command in commands))
+            output = ''
+            while True:
+                output += self.connection.read_channel()
+                # Anything before the first echo is left over from earlier and is not part of a reply
+                position = output.find(commands[0])
+                if position >= 0:
+                    output = output[position:]
+                    prompts = min(len(done.findall(output)), len(commands))
+                    arrivals.extend([time.perf_counter()] * (prompts - len(arrivals)))
+                    if len(arrivals) == len(commands) and end.search(output[-256:]):
+                        break
+                if time.perf_counter() - start > read_timeout:
+                    raise ReadTimeout(f"No prompt after {len(commands)} batched commands within {read_timeout}s")
+                time.sleep(BATCH_LOOP_DELAY)
+        outputs = split_batch_output(self.connection.normalize_linefeeds(output), commands, prompt)
+        # Each reply is timed from the one before it, so per-command histograms and the adaptive
+        # timeouts see one command's latency, and a batch waits len(commands) x that timeout
+        for command, previous, arrived in zip(commands, [start] + arrivals, arrivals):
+            timings.observe('ssh.command', arrived - previous, command)
+            self.latencies.append(('command', arrived - previous))
+        return outputs
 
     def __enter__(self):
         self.connect()
@@ -3,24 +3,81 @@ import queue
 import logging
 import traceback
 import re
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta
 from typing import Dict, List
 from devices import NetworkDevice
 from data import DeviceDatabase
+from credentials import CredentialChain
+from filters import HostFilter
+from frontier import Frontier, SCHEDULERS
+from visited import VisitedIndex
+from timing import timings
+from timeouts import AdaptiveTimeouts
+from metrics import MetricsServer, metrics
+from reachability import DEFAULT_PROBE_TIMEOUT, ReachabilityScanner
 
 class NetworkCrawler:
     def __init__(self, seed_device: str, username: str, password: str, 
                  device_type: str = 'cisco_ios', max_workers: int = 5,
                  exclude_hosts: List[str] = None, include_only: List[str] = None,
-                 db_path: str = 'network_devices.db'):
+                 db_path: str = 'network_devices.db', use_bloom: bool = False,
+                 engine: str = 'threads', port: int = 22, metrics_port: int = None,
+                 resume: bool = False, crawl_id: str = None, recrawl_ttl_hours: float = None,
+                 scheduler='priority', max_depth: int = None, max_per_site: int = None,
+                 max_per_parent: int = None, session_profile: str = 'fast', connect_timeout: float = 20,
+                 adaptive_timeouts: bool = True, timeout_margin: float = 3.0,
+                 tcp_precheck_timeout: float = 1.0, prescan: bool = True, prescan_concurrency: int = 256,
+                 batch_commands: bool = True, fallback_credentials: List[Dict] = None):
         self.seed_device = seed_device
         self.username = username
         self.password = password
         self.device_type = device_type
         self.max_workers = max_workers
+        self.engine = engine  # 'threads' or 'async'
+        self.port = port
+        self.session_profile = session_profile  # 'fast' or 'conservative' netmiko sessions for the threaded engine
+        self.batch_commands = batch_commands  # Send a visit's commands in one pipelined write
+        self.connect_timeout = connect_timeout  # Used until a host or its platform has latency history
+        self.tcp_precheck_timeout = tcp_precheck_timeout  # None connects over SSH without checking TCP first
+        # Probe TCP/22 of queued devices in parallel, so unreachable ones never take a worker
+        self.prescan = prescan
+        self.prescan_concurrency = prescan_concurrency
+        self.scanner = None
         self.exclude_hosts = exclude_hosts or []
         self.include_only = include_only or []
+        # Compiled once, the rule lists are only kept for logging and the config hash
+        self.exclude_filter = HostFilter(self.exclude_hosts)
+        self.include_filter = HostFilter(self.include_only)
         self.db = DeviceDatabase(db_path)
+        # username/password first, then each fallback account in order
+        self.credentials = CredentialChain(
+            [{'username': username, 'password': password}] + list(fallback_credentials or []),
+            db=self.db, site_of=self._site_of
+        )
+        self.timeouts = AdaptiveTimeouts(self.db, margin=timeout_margin) if adaptive_timeouts else None
+        # Name from SCHEDULERS or any object with score(entry), lower scores are visited first
+        self.scheduler = SCHEDULERS[scheduler]() if isinstance(scheduler, str) else scheduler
+        self.frontier = Frontier(self.scheduler)
+        self.visited = VisitedIndex(use_bloom=use_bloom)
         self.workers = []
+        self.async_engine = None
+        self.metrics_port = metrics_port  # Serve Prometheus metrics on this port while crawling
+        self.metrics_server = None
+        self.resume = resume  # Continue an interrupted crawl instead of starting from the seed
+        self.crawl_id = crawl_id  # Crawl to resume, the latest unfinished one if None
+        self.run_id = None  # Unique per start(), prefixes lease owners so a restart can reclaim them
+        # Incremental mode: only devices crawled longer ago than this are visited again
+        self.recrawl_ttl_hours = recrawl_ttl_hours
+        self.fresh_since = None
+        # Crawl bounds, None means unlimited
+        self.max_depth = max_depth  # Hops from the seed, the seed is depth 0
+        self.max_per_site = max_per_site  # Devices queued per site-xx prefix
+        self.max_per_parent = max_per_parent  # Neighbours queued from any one device
+        self._site_counts = {}
+        self._site_lock = threading.Lock()
         self.running = False
         
         # Configure logging
@@ -42,6 +99,7 @@ class NetworkCrawler:
         self.logger.info(f"Initialized crawler with seed device: {seed_device}")
         self.logger.info(f"Exclude hosts: {self.exclude_hosts}")
         self.logger.info(f"Include only: {self.include_only}")
+        self.logger.info(f"Limits: max depth {max_depth}, max per site {max_per_site}, max per parent {max_per_parent}")
 
     def _clean_hostname(self, hostname: str) -> str:
         """Clean hostname to site-xx-xx format"""
@@ -51,38 +109,217 @@ class NetworkCrawler:
             return match.group(1)
         return hostname
 
-    def _should_process_hostname(self, hostname: str) -> bool:
-        """Check if a hostname should be processed"""
+    @staticmethod
+    def _site_of(hostname: str) -> str:
+        """Get the site-xx prefix of a hostname, None if it does not follow the naming scheme"""
+        match = re.match(r'^(site-\d+)', hostname)
+        return match.group(1) if match else None
+
+    def _reserve_site_slot(self, hostname: str) -> bool:
+        """Count a device against its site's cap, returns False once the site is full"""
+        site = self._site_of(hostname)
+        if self.max_per_site is None or site is None:
+            return True
+        with self._site_lock:
+            count = self._site_counts.get(site, 0)
+            if count >= self.max_per_site:
+                return False
+            self._site_counts[site] = count + 1
+            if count + 1 == self.max_per_site:
+                self.logger.warning(f"Site {site} reached its cap of {self.max_per_site} devices, not queueing more")
+            return True
+
+    def _load_site_counts(self, hostnames: List[str]):
+        """Count the devices already queued per site, so a resumed crawl keeps its caps"""
+        self._site_counts = {}
+        for hostname in hostnames:
+            site = self._site_of(hostname)
+            if site:
+                self._site_counts[site] = self._site_counts.get(site, 0) + 1
+
+    def _is_up_to_date(self, hostname: str) -> bool:
+        """Check if the database already has a device that does not need visiting again"""
+        if self.fresh_since is None:
+            if self.db.is_device_known(hostname):
+                self.visited.add(hostname)
+                return True
+            return False
+        # Not cached in the index, a changed neighbour may still force a revisit
+        return self.db.is_device_known(hostname, fresh_since=self.fresh_since)
+
+    def _should_process_hostname(self, hostname: str, force: bool = False, mgmt_ip: str = None,
+                                 fqdn: str = None) -> bool:
+        """Check if a hostname should be processed, force skips the already-crawled check.
+
+        fqdn is the name as CDP reported it, before it was cut down to site-xx-xx,
+        so domain rules can match it.
+        """
         # Clean the hostname first
         clean_hostname = self._clean_hostname(hostname)
         
-        # Check if already processed
-        if self.db.is_device_known(clean_hostname):
+        # Check if already processed, the database is only asked when the index misses
+        if clean_hostname in self.visited:
+            self.logger.debug(f"Hostname {clean_hostname} already processed")
+            return False
+        if not force and self._is_up_to_date(clean_hostname):
             self.logger.debug(f"Hostname {clean_hostname} already processed")
             return False
             
-        if clean_hostname in self.exclude_hosts:
+        if self.exclude_filter.matches(clean_hostname, fqdn, ip=mgmt_ip):
             self.logger.debug(f"Hostname {clean_hostname} is in excluded list")
             return False
-        if self.include_only and clean_hostname not in self.include_only:
+        if self.include_filter and not self.include_filter.matches(clean_hostname, fqdn, ip=mgmt_ip):
             self.logger.debug(f"Hostname {clean_hostname} is not in included list")
             return False
         return True
 
+    def config_hash(self) -> str:
+        """Hash the settings that decide what a crawl visits"""
+        config = {
+            'seed_device': self.seed_device,
+            'device_type': self.device_type,
+            'exclude_hosts': sorted(self.exclude_hosts),
+            'include_only': sorted(self.include_only),
+            'max_depth': self.max_depth,
+            'max_per_site': self.max_per_site,
+            'max_per_parent': self.max_per_parent
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def _resume_queue(self) -> bool:
+        """Reload the frontier from crawl_queue, returns False if there is nothing to resume"""
+        checkpoint = self.db.get_checkpoint(self.crawl_id)
+        if checkpoint is None:
+            target = f"crawl {self.crawl_id}" if self.crawl_id else "unfinished crawl"
+            self.logger.warning(f"No {target} to resume, starting a new one")
+            return False
+        
+        self.crawl_id = checkpoint['crawl_id']
+        if checkpoint['config_hash'] != self.config_hash():
+            self.logger.warning(f"Crawl {self.crawl_id} was started with different settings, resuming anyway")
+        
+        # The previous run is gone, so its claims will never complete even if their lease has not expired
+        reclaimed = self.db.reclaim_leases(f"{checkpoint['run_id']}:" if checkpoint['run_id'] else None)
+        entries = self.db.get_pending_entries()
+        if not entries:
+            self.logger.info(f"Crawl {self.crawl_id} has nothing left to visit, starting a new one")
+            self.db.set_checkpoint_status(self.crawl_id, 'finished')
+            return False
+        for entry in entries:
+            self._dispatch(entry)
+        self.logger.info(f"Resuming crawl {self.crawl_id} started {checkpoint['started_at']}: "
+                         f"{len(entries)} pending devices, {reclaimed} claims reclaimed from the previous run")
+        return True
+
+    def _enqueue(self, entry: Dict):
+        """Score an entry, persist it to crawl_queue and hand it to the workers"""
+        self.frontier.prioritise(entry)
+        self.db.add_to_queue(**entry)
+        self._dispatch(entry)
+
+    def _dispatch(self, entry: Dict):
+        """Hand a queued entry to the workers, through the reachability pre-scan if it is running"""
+        if self.scanner:
+            self.scanner.submit(entry)
+        else:
+            self.frontier.put(entry)
+
+    def _on_probe_result(self, entry: Dict, reason: str):
+        """Called by the scanner, reachable entries go on to the frontier and the rest are closed"""
+        if reason is None:
+            entry['reachable'] = True
+            self.frontier.put(entry)
+            return
+        self.logger.info(f"Not visiting {entry['hostname']} (mgmt IP: {entry.get('mgmt_ip') or 'N/A'}), TCP port {self.port} {reason}")
+        self.db.mark_unreachable(entry['hostname'], reason)
+        metrics.device_unreachable(reason)
+
+    def _queue_stale_devices(self) -> int:
+        """Queue every device crawled before the freshness cutoff, stalest first"""
+        queued = 0
+        for entry in self.db.get_stale_devices(self.fresh_since):
+            # Devices keep the depth they were last reached at, so max_depth still bounds a re-crawl
+            if self.max_depth is not None and entry['depth'] > self.max_depth:
+                metrics.devices_skipped('max_depth')
+                continue
+            if (self._should_process_hostname(entry['hostname'], force=True, mgmt_ip=entry['mgmt_ip'])
+                    and self.visited.add(entry['hostname'])):
+                self._enqueue(entry)
+                queued += 1
+        self.logger.info(f"Queued {queued} devices last crawled before {self.fresh_since:%Y-%m-%d %H:%M}")
+        return queued
+
+    def _queue_seed(self) -> bool:
+        """Queue the seed device, returns False if it is excluded from processing"""
+        if not self._should_process_hostname(self.seed_device):
+            self.logger.warning(f"Seed device {self.seed_device} is excluded from processing or already crawled")
+            return False
+        self.visited.add(self.seed_device)
+        seed_entry = {
+            'hostname': self.seed_device,
+            'mgmt_ip': None,
+            'device_type': None,
+            'parent': None,
+            'depth': 0
+        }
+        self._enqueue(seed_entry)
+        self.logger.info(f"Added seed device {self.seed_device} to queue")
+        return True
+
     def start(self):
         """Start the crawler with the specified number of worker threads"""
         self.logger.info(f"Starting crawler with {self.max_workers} workers")
         self.running = True
+        self.run_id = uuid.uuid4().hex[:12]
         
-        # Clear any existing queue
-        self.db.clear_queue()
+        self.frontier.reset()
+        self.visited.clear()
+        if self.timeouts:
+            self.timeouts.load()
+        timings.reset()
+        metrics.reset()
+        if self.metrics_port is not None and self.metrics_server is None:
+            self.metrics_server = MetricsServer(self._render_metrics, port=self.metrics_port)
+            try:
+                self.metrics_server.start()
+            except OSError as e:
+                # The endpoint is only for observation, a taken port should not stop the crawl
+                self.logger.warning(f"Could not serve metrics on port {self.metrics_port}, continuing without them: {str(e)}")
+                self.metrics_server = None
+        if self.prescan and self.scanner is None:
+            self.scanner = ReachabilityScanner(
+                self._on_probe_result, port=self.port, timeout=self.tcp_precheck_timeout or DEFAULT_PROBE_TIMEOUT,
+                max_in_flight=self.prescan_concurrency
+            )
+            self.scanner.start()
         
-        # Add seed device to queue if it should be processed
-        if self._should_process_hostname(self.seed_device):
-            self.db.add_to_queue(self.seed_device)
-            self.logger.info(f"Added seed device {self.seed_device} to queue")
+        resumed = self.resume and self._resume_queue()
+        if not resumed:
+            # Start over from the seed
+            self.db.clear_queue()
+            self.crawl_id = uuid.uuid4().hex
+        self.db.save_checkpoint(self.crawl_id, self.config_hash(), self.seed_device, self.run_id)
+        self.credentials.load(self.crawl_id)
+        if self.recrawl_ttl_hours is None:
+            self.fresh_since = None
+            self.visited.load(self.db.get_known_hostnames())
         else:
-            self.logger.warning(f"Seed device {self.seed_device} is excluded from processing")
+            # Known devices are checked for freshness as they are seen instead of preloaded
+            self.fresh_since = datetime.now() - timedelta(hours=self.recrawl_ttl_hours)
+            self.visited.load(self.db.get_queued_hostnames())
+        self._load_site_counts(self.db.get_queued_hostnames())
+        
+        # A resumed crawl already has its frontier, a new one starts from the seed
+        if not resumed:
+            stale = self._queue_stale_devices() if self.fresh_since else 0
+            if not self._queue_seed() and not stale:
+                return
+        
+        if self.engine == 'async':
+            # Imported here so the threaded engine does not need asyncssh
+            from async_engine import AsyncCrawlEngine
+            self.async_engine = AsyncCrawlEngine(self, max_sessions=self.max_workers)
+            self.async_engine.start()
             return
         
         # Start worker threads
@@ -95,19 +332,13 @@ class NetworkCrawler:
 
     def _connect_device(self, device, hostname) -> bool:
         try:
-            self.logger.info(f"Attempting to connect to {hostname} via hostname")
+            # NetworkDevice tries the management IP first and falls back to the hostname
+            self.logger.info(f"Attempting to connect to {hostname} (mgmt IP: {device.mgmt_ip or 'N/A'})")
             device.connect()
             return True
         except ConnectionError as e:
-            self.logger.warning(f"Failed to connect to {hostname} via hostname: {str(e)}")
-            # If we have a management IP, try that as fallback
-            if device.mgmt_ip:
-                self.logger.info(f"Attempting fallback connection to {hostname} via management IP: {device.mgmt_ip}")
-                device.connect()  # This will use the management IP as fallback
-                return True
-            else:
-                self.logger.error(f"No management IP available for {hostname}, skipping")
-                return False
+            self.logger.error(f"Failed to connect to {hostname}, skipping: {str(e)}")
+            return False
 
     # Checks if the neighbour is valid for processing based on the hostname and format      
     def _is_neighbour_valid(self, neighbour, hostname)-> str:
@@ -121,10 +352,32 @@ class NetworkCrawler:
             return False
         return True
 
+    def _neighbor_set_changed(self, device_info: Dict, neighbors: List[Dict]) -> bool:
+        """Hash the neighbour hostnames into device_info, True if they differ from the last crawl"""
+        names = sorted({self._clean_hostname(neighbor.get('hostname') or '') for neighbor in neighbors})
+        device_info['neighbor_hash'] = hashlib.sha1("\n".join(names).encode()).hexdigest()
+        if self.fresh_since is None:
+            return False
+        previous = self.db.get_neighbor_hash(device_info['hostname'])
+        if previous is not None and previous != device_info['neighbor_hash']:
+            self.logger.info(f"Neighbour set of {device_info['hostname']} changed since its last crawl, revisiting its neighbours")
+            return True
+        return False
+
+    def _limit_reached(self, depth: int, queued: int) -> str:
+        """Name the depth or fan-out limit a new neighbour would break, None if it fits"""
+        if self.max_depth is not None and depth > self.max_depth:
+            return 'max_depth'
+        if self.max_per_parent is not None and queued >= self.max_per_parent:
+            return 'max_per_parent'
+        return None
+
     # trys to add neigbours to db
     # Returns a list of all the valid neighbours
-    def _try_add_neighbours(self, neighbors) -> list:
+    def _try_add_neighbours(self, neighbors, parent: Dict, force: bool = False) -> list:
         valid_neighbors = []
+        depth = (parent.get('depth') or 0) + 1
+        skipped = {}
         for neighbor in neighbors:
             neighbor_hostname = neighbor.get('hostname')
             
@@ -132,102 +385,170 @@ class NetworkCrawler:
                 continue
 
             clean_neighbor = self._clean_hostname(neighbor_hostname)
-            if self._should_process_hostname(clean_neighbor):
-                # Store both hostname and management IP for fallback
-                neighbor_info = {
-                    'hostname': clean_neighbor,
-                    'mgmt_ip': neighbor.get('ip', ''),  # Store the management IP for fallback
-                    'device_type': neighbor.get('device_type', self.device_type)  # Use detected type or fallback
-                }
-                valid_neighbors.append(neighbor_info)
-                self.db.add_to_queue(clean_neighbor)
-                self.logger.debug(f"Added neighbor to queue: {clean_neighbor} (IP: {neighbor.get('ip', 'N/A')}, Type: {neighbor_info['device_type']})")
+            if not self._should_process_hostname(clean_neighbor, force, mgmt_ip=neighbor.get('ip') or None,
+                                                 fqdn=neighbor_hostname):
+                continue
+            limit = self._limit_reached(depth, len(valid_neighbors))
+            if limit is None:
+                # visited.add is the atomic gate, only the first parent to see a neighbour queues it
+                if not self.visited.add(clean_neighbor):
+                    continue
+                # Site caps are shared across parents, so a device only counts once it has passed the gate
+                if not self._reserve_site_slot(clean_neighbor):
+                    limit = 'max_per_site'
+            if limit:
+                skipped[limit] = skipped.get(limit, 0) + 1
+                metrics.devices_skipped(limit)
+                continue
+
+            # Carry what CDP told us so the worker can connect by IP with the right driver
+            neighbor_info = {
+                'hostname': clean_neighbor,
+                'mgmt_ip': neighbor.get('ip') or None,
+                'device_type': neighbor.get('device_type', self.device_type),  # Use detected type or fallback
+                'parent': parent['hostname'],
+                'depth': depth,
+                'platform': neighbor.get('platform') or None,
+                'capabilities': neighbor.get('capabilities') or None
+            }
+            valid_neighbors.append(neighbor_info)
+            self._enqueue(neighbor_info)
+            self.logger.debug(f"Added neighbor to queue: {clean_neighbor} (IP: {neighbor.get('ip', 'N/A')}, Type: {neighbor_info['device_type']})")
 
+        if skipped:
+            self.logger.info(f"Not queueing neighbours of {parent['hostname']} (depth {depth - 1}) past crawl limits: {skipped}")
         return valid_neighbors
 
 
-    def _process_device(self, hostname: str) -> List[str]:
-        """Process a single device and return list of discovered neighbors"""
-        self.logger.info(f"Processing device: {hostname}")
-        device = NetworkDevice(
-            hostname=hostname,
+    def _build_device(self, entry: Dict, worker_id: str) -> NetworkDevice:
+        """Create the NetworkDevice for a queued entry"""
+        # Reuse the platform seen on a previous crawl, else the one CDP reported for this neighbour
+        known_type = self.db.get_device_type(entry['hostname'])
+        device_type = known_type or entry.get('device_type') or self.device_type
+        connect_timeout, command_timeout = self.connect_timeout, None
+        if self.timeouts:
+            connect_timeout = self.timeouts.timeout(entry['hostname'], device_type, 'connect', self.connect_timeout)
+            command_timeout = self.timeouts.timeout(entry['hostname'], device_type, 'command')
+        return NetworkDevice(
+            hostname=entry['hostname'],
             username=self.username,
             password=self.password,
-            device_type=self.device_type,
-            worker_id=threading.current_thread().name  # Pass worker thread name as ID
+            device_type=device_type,
+            mgmt_ip=entry.get('mgmt_ip'),
+            worker_id=worker_id,
+            detect_type=known_type is None,
+            port=self.port,
+            session_profile=self.session_profile,
+            connect_timeout=connect_timeout,
+            command_timeout=command_timeout,
+            # Entries that passed the pre-scan were probed moments ago
+            precheck_timeout=None if entry.get('reachable') else self.tcp_precheck_timeout,
+            credentials=self.credentials
         )
-        
-        try:
-            # First try connecting with hostname
-            if not self._connect_device(device, hostname=hostname):
-                self.logger.warning(f"Failed to connect to {hostname} via hostname: {str(e)}")
-                return []
 
-            # Step 1: Get device info from show version
-            self.logger.info(f"Getting device info from {hostname}")
+    def _record_latencies(self, device: NetworkDevice, entry: Dict):
+        """Feed a visit's connect and command latencies to the adaptive timeouts"""
+        if self.timeouts:
+            self.timeouts.record(entry['hostname'], device.device_type, device.latencies)
+
+    def _collect_device(self, device: NetworkDevice, entry: Dict) -> List[Dict]:
+        """Read device info and neighbours from a connected device and store them"""
+        hostname = entry['hostname']
+
+        # Step 1: Get device info from show version
+        self.logger.info(f"Getting device info from {hostname}")
+        with timings.span('crawl.device_info'):
             device_info = device.get_device_info()
-            if not device_info:
-                self.logger.error(f"Failed to get device info from {hostname}")
-                return []
-                
-            # Step 2: Clean hostname before storing
-            device_info['hostname'] = self._clean_hostname(device_info['hostname'])
+        if not device_info:
+            self.logger.error(f"Failed to get device info from {hostname}")
+            return []
+            
+        # Step 2: Clean hostname before storing
+        device_info['hostname'] = self._clean_hostname(device_info['hostname'])
+        # Stored so a re-crawl requeues the device at the depth this crawl reached it
+        device_info['depth'] = entry.get('depth') or 0
 
-            # Step 3: Get CDP neighbors
-            self.logger.info(f"Getting CDP neighbors from {hostname}")
+        # Step 3: Get CDP neighbors
+        self.logger.info(f"Getting CDP neighbors from {hostname}")
+        with timings.span('crawl.cdp_neighbors'):
             neighbors = device.get_cdp_neighbors()
-            if not neighbors:
-                self.logger.warning(f"No CDP neighbors found for {hostname}")
-                # Even if no neighbors, we should still add the device to DB
+        changed = self._neighbor_set_changed(device_info, neighbors or [])
+        if not neighbors:
+            self.logger.warning(f"No CDP neighbors found for {hostname}")
+            # Even if no neighbors, we should still add the device to DB
+            with timings.span('crawl.store'):
                 self.db.add_device(device_info)
-                return []
-                
-            self.logger.info(f"Found {len(neighbors)} neighbors for {hostname}")
+            return []
             
-            # Step 4: Process and add neighbors to queue
-            valid_neighbors = self._try_add_neighbours(neighbors)
+        self.logger.info(f"Found {len(neighbors)} neighbors for {hostname}")
+        
+        # Step 4: Process and add neighbors to queue, all of them if the neighbour set changed
+        with timings.span('crawl.queue_neighbors'):
+            valid_neighbors = self._try_add_neighbours(neighbors, entry, force=changed)
 
-            # Step 5: Only after processing neighbors, add the device to DB
+        # Step 5: Only after processing neighbors, add the device to DB
+        with timings.span('crawl.store'):
             self.db.add_device(device_info)
-            self.logger.info(f"Added device info for {hostname}")
+        self.logger.info(f"Added device info for {hostname}")
 
-            self.logger.info(f"Added {len(valid_neighbors)} valid neighbors to queue")
-            return valid_neighbors
-            
+        self.logger.info(f"Added {len(valid_neighbors)} valid neighbors to queue")
+        return valid_neighbors
+
+    def _process_device(self, entry: Dict) -> List[Dict]:
+        """Process a single queued device and return list of discovered neighbors"""
+        hostname = entry['hostname']
+        self.logger.info(f"Processing device: {hostname} (depth {entry.get('depth', 0)}, via {entry.get('parent') or 'seed'})")
+        device = self._build_device(entry, threading.current_thread().name)  # Pass worker thread name as ID
+        
+        try:
+            with timings.span('crawl.visit'):
+                if not self._connect_device(device, hostname=hostname):
+                    return []
+                if self.batch_commands:
+                    device.prefetch()
+                return self._collect_device(device, entry)
         except Exception as e:
             self.logger.error(f"Error processing device {hostname}: {str(e)}")
             self.logger.error(f"Traceback: {traceback.format_exc()}")
             return []
         finally:
             device.disconnect()
+            self._record_latencies(device, entry)
+
+    def _claim_entry(self, entry: Dict, owner: str) -> bool:
+        """Claim the row atomically so no other worker opens a second session"""
+        if not self.db.claim_device(entry['hostname'], f"{self.run_id}:{owner}"):
+            self.logger.debug(f"Device {entry['hostname']} already claimed by another worker, skipping")
+            return False
+        return True
+
+    def _complete_entry(self, hostname: str):
+        """Mark a device as processed and count it in the metrics"""
+        self.db.mark_processed(hostname)
+        metrics.device_processed()
+        self.logger.info(f"Marked {hostname} as processed")
+
+    def _render_metrics(self) -> str:
+        """Render metrics for a scrape"""
+        return metrics.render(self.db.get_queue_status(), len(self.frontier))
 
     def _worker(self):
         """Worker thread function"""
         while self.running:
             try:
-                # Get next device from queue
-                hostname = self.db.get_next_device()
-                if not hostname:
-                    self.logger.debug("Queue is empty, waiting...")
+                # Block until a device is queued, the timeout only bounds shutdown latency
+                entry = self.frontier.get(timeout=1.0)
+                if not entry:
+                    continue
+                hostname = entry['hostname']
+                
+                if not self._claim_entry(entry, threading.current_thread().name):
                     continue
                 
                 try:
-                    # Skip if device already processed
-                    if self.db.is_device_known(hostname):
-                        self.logger.info(f"Device {hostname} already processed, skipping")
-                        self.db.mark_processed(hostname)
-                        continue
-                    
                     # Process device and get neighbors
-                    neighbors = self._process_device(hostname)
-                    
-                    # Mark device as processed
-                    self.db.mark_processed(hostname)
-                    self.logger.info(f"Marked {hostname} as processed")
-                    
-                    # Log queue status
-                    status = self.db.get_queue_status()
-                    self.logger.info(f"Queue status: {status['pending']} pending, {status['processed']} processed")
+                    neighbors = self._process_device(entry)
+                    self._complete_entry(hostname)
                     
                 except Exception as e:
                     # If anything goes wrong, release the device from processing state
@@ -244,8 +565,22 @@ class NetworkCrawler:
         """Stop the crawler"""
         self.logger.info("Stopping crawler...")
         self.running = False
+        self.frontier.close()
+        if self.scanner:
+            self.scanner.stop()
+            self.scanner = None
+        if self.async_engine:
+            self.async_engine.stop()
         for worker in self.workers:
             worker.join()
+        self.db.flush()
+        if self.crawl_id:
+            status = self.db.get_queue_status(refresh=True)
+            self.db.set_checkpoint_status(self.crawl_id, 'stopped' if status['pending'] else 'finished')
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self.logger.info(f"Timing summary:\n{timings.format_table()}")
         self.logger.info("Crawler stopped")
 
     def get_status(self) -> Dict:
@@ -257,4 +592,10 @@ class NetworkCrawler:
     def export_results(self, output_path: str):
         """Export results to CSV"""
         self.logger.info(f"Exporting results to {output_path}")
-        self.db.export_to_csv(output_path) 
\ No newline at end of file
+        self.db.flush()
+        self.db.export_to_csv(output_path)
+
+    def export_timings(self, output_path: str):
+        """Export per-phase timing histograms to JSON, or CSV for a .csv path"""
+        self.logger.info(f"Exporting timings to {output_path}")
+        timings.export(output_path)
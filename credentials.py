@@ -0,0 +1,100 @@
+import threading
+from collections import Counter
+from typing import Callable, Dict, List
+import logging
+
+
+class CredentialChain:
+    """Ordered login credentials, remembering which one each host and site accepts.
+
+    A device is offered the credential that last worked for it, then the
+    one that works for most hosts in its site, then the rest in config order.
+    A credential a device rejected is not offered to it again for the rest
+    of the crawl, whichever worker or target address tries next. Working
+    credentials are stored in host_credentials and rejections in
+    auth_failures, so later crawls start from what this one learned and
+    a resumed crawl does not retry its rejections.
+    """
+
+    def __init__(self, credentials: List[Dict], db=None, site_of: Callable[[str], str] = None):
+        self.credentials = []
+        for credential in credentials:
+            name = credential.get('name') or credential['username']
+            # Two entries for the same account with different passwords still need distinct names
+            if any(existing['name'] == name for existing in self.credentials):
+                name = f"{name}#{len(self.credentials) + 1}"
+            self.credentials.append({'name': name, 'username': credential['username'],
+                                     'password': credential['password']})
+        self.db = db
+        self.site_of = site_of or (lambda hostname: None)
+        self.crawl_id = None
+        self._hosts = {}  # hostname -> name of the credential that last worked
+        self._sites = {}  # site -> Counter of credential names its hosts accept
+        self._failed = {}  # hostname -> names of credentials it rejected this crawl
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def load(self, crawl_id: str = None):
+        """Read the credentials earlier crawls saw work, and the rejections of crawl_id"""
+        self.crawl_id = crawl_id
+        if self.db is None:
+            return
+        names = {credential['name'] for credential in self.credentials}
+        hosts, sites, failed = {}, {}, {}
+        for row in self.db.get_host_credentials():
+            if row['credential'] in names:
+                hosts[row['hostname']] = row['credential']
+                if row['site']:
+                    sites.setdefault(row['site'], Counter())[row['credential']] += 1
+        if crawl_id:
+            for row in self.db.get_auth_failures(crawl_id):
+                failed.setdefault(row['hostname'], set()).add(row['credential'])
+        with self._lock:
+            self._hosts, self._sites, self._failed = hosts, sites, failed
+        self.logger.info(f"Loaded working credentials for {len(hosts)} hosts and {len(sites)} sites, "
+                         f"{sum(len(names) for names in failed.values())} rejections")
+
+    def candidates(self, hostname: str) -> List[Dict]:
+        """Credentials to try on a host in order, leaving out those it already rejected"""
+        with self._lock:
+            # Unary plus drops credentials whose hosts all went on to reject them
+            site = (+self._sites.get(self.site_of(hostname), Counter())).most_common(1)
+            preferred = [self._hosts.get(hostname), site[0][0] if site else None]
+            failed = self._failed.get(hostname, set())
+        order = {}
+        for name in preferred:
+            if name:
+                order.setdefault(name, len(order))
+        ranked = sorted(self.credentials, key=lambda credential: order.get(credential['name'], len(order)))
+        return [credential for credential in ranked if credential['name'] not in failed]
+
+    def succeeded(self, hostname: str, credential: Dict):
+        """Remember a credential that a host accepted"""
+        site = self.site_of(hostname)
+        with self._lock:
+            previous = self._hosts.get(hostname)
+            changed = previous != credential['name']
+            self._hosts[hostname] = credential['name']
+            if site and changed:
+                counts = self._sites.setdefault(site, Counter())
+                if previous:
+                    counts[previous] -= 1
+                counts[credential['name']] += 1
+        if changed and self.db is not None:
+            self.db.save_host_credential(hostname, credential['name'], site)
+
+    def failed(self, hostname: str, credential: Dict):
+        """Record that a host rejected a credential, so it is not offered to the host again"""
+        self.logger.warning(f"{hostname} rejected credential {credential['name']}")
+        site = self.site_of(hostname)
+        with self._lock:
+            self._failed.setdefault(hostname, set()).add(credential['name'])
+            if self._hosts.get(hostname) == credential['name']:
+                del self._hosts[hostname]
+                if site in self._sites:
+                    self._sites[site][credential['name']] -= 1
+        if self.db is not None and self.crawl_id:
+            self.db.record_auth_failure(self.crawl_id, hostname, credential['name'])
+
+    def __len__(self) -> int:
+        return len(self.credentials)
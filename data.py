@@ -1,22 +1,206 @@
 import sqlite3
 from typing import Dict, List
 import csv
+import json
 from datetime import datetime
 import logging
+import queue
+import threading
+import time
 import traceback
+from timing import timings
+
+# How long a worker may hold a claimed queue row before others can reclaim it
+DEFAULT_LEASE_SECONDS = 600
+
+# Queue row states tracked in memory for get_queue_status
+QUEUE_STATES = ('pending', 'processing', 'processed')
+
+# Per-connection pragmas, WAL lets readers run alongside the writer
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -20000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 30000',
+)
+
+class LockWaitStats:
+    """Time spent waiting for SQLite's write lock, summed over every connection"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def begin_immediate(self, conn: sqlite3.Connection):
+        """Open a write transaction, recording how long the lock took to acquire"""
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        waited = time.perf_counter() - start
+        timings.observe('db.lock_wait', waited)
+        with self._lock:
+            self.count += 1
+            self.total_seconds += waited
+            self.max_seconds = max(self.max_seconds, waited)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'count': self.count,
+                'total_seconds': self.total_seconds,
+                'max_seconds': self.max_seconds
+            }
+
+
+class BatchWriter:
+    """Single writer thread that commits queued write intents in batches.
+
+    Callers hand over (sql, params) pairs and return immediately; the writer
+    commits whatever has accumulated once batch_size intents are waiting or
+    flush_interval seconds have passed, grouping runs of the same statement
+    into executemany().
+    """
+
+    def __init__(self, get_connection, batch_size: int = 500, flush_interval: float = 0.05,
+                 lock_waits: LockWaitStats = None):
+        self._get_connection = get_connection
+        self.lock_waits = lock_waits or LockWaitStats()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self.logger = logging.getLogger(__name__)
+        self._thread = threading.Thread(target=self._run, name="DB-Writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql: str, params: tuple):
+        """Queue a write intent for the next batch"""
+        self._queue.put((sql, params))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every intent submitted before this call is committed"""
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        barrier = threading.Event()
+        self._queue.put(barrier)
+        return barrier.wait(timeout)
+
+    def close(self):
+        """Flush outstanding writes and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            item = self._queue.get()
+            batch, barriers = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    # Commit what we have right away so the barrier returns quickly
+                    barriers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch)
+            for barrier in barriers:
+                barrier.set()
+
+    def _commit(self, batch: List[tuple]):
+        """Commit one batch, falling back to row-by-row if the batch fails"""
+        conn = self._get_connection()
+        try:
+            with timings.span('db.commit'):
+                self.lock_waits.begin_immediate(conn)
+                for sql, rows in self._group(batch):
+                    conn.executemany(sql, rows)
+                conn.commit()
+            self.logger.debug(f"Committed batch of {len(batch)} writes")
+        except sqlite3.Error as e:
+            conn.rollback()
+            self.logger.error(f"Batch commit of {len(batch)} writes failed, retrying individually: {str(e)}")
+            for sql, params in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    self.logger.error(f"Database write failed: {str(e)}")
+                    self.logger.error(f"Traceback: {traceback.format_exc()}")
+
+    @staticmethod
+    def _group(batch: List[tuple]) -> List[tuple]:
+        """Group consecutive intents that share a statement, keeping their order"""
+        groups = []
+        for sql, params in batch:
+            if groups and groups[-1][0] == sql:
+                groups[-1][1].append(params)
+            else:
+                groups.append((sql, [params]))
+        return groups
+
 
 class DeviceDatabase:
     def __init__(self, db_path: str = 'network_devices.db'):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.lock_waits = LockWaitStats()  # Shared by the writer thread and direct claims
+        # hostname -> queue state, so status reads never scan crawl_queue
+        self._queue_states = {}
+        self._queue_counts = dict.fromkeys(QUEUE_STATES, 0)
+        self._queue_lock = threading.Lock()
         self._init_db()
+        self._writer = BatchWriter(self._get_connection, lock_waits=self.lock_waits)
         
         # Configure logging
         self.logger = logging.getLogger(__name__)
         self.logger.debug(f"Initialized DeviceDatabase with path: {db_path}")
+        self.reconcile_queue_counts()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Return this thread's persistent connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Statements are compiled once per connection and reused from the cache
+            conn = sqlite3.connect(self.db_path, timeout=30, cached_statements=256,
+                                   check_same_thread=False)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until all queued writes have been committed"""
+        return self._writer.flush(timeout)
+
+    def close(self):
+        """Flush pending writes and close every pooled connection"""
+        self._writer.close()
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
 
     def _init_db(self):
         """Initialize the database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             
             # Create devices table with only essential fields
@@ -27,9 +211,12 @@ class DeviceDatabase:
                     serial_number TEXT,
                     platform TEXT,
                     device_type TEXT,
-                    last_crawled TIMESTAMP
+                    last_crawled TIMESTAMP,
+                    neighbor_hash TEXT,
+                    depth INTEGER
                 )
             ''')
+            self._add_missing_columns(cursor, 'devices', {'neighbor_hash': 'TEXT', 'depth': 'INTEGER'})
             
             # Create crawl_queue table with processing state
             cursor.execute('''
@@ -37,7 +224,79 @@ class DeviceDatabase:
                     hostname TEXT PRIMARY KEY,
                     added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     processed BOOLEAN DEFAULT 0,
-                    processing BOOLEAN DEFAULT 0
+                    processing BOOLEAN DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    mgmt_ip TEXT,
+                    device_type TEXT,
+                    parent TEXT,
+                    depth INTEGER DEFAULT 0,
+                    platform TEXT,
+                    capabilities TEXT,
+                    priority REAL DEFAULT 0,
+                    unreachable_reason TEXT
+                )
+            ''')
+            self._add_missing_columns(cursor, 'crawl_queue', {
+                'lease_owner': 'TEXT',
+                'lease_expires': 'REAL',
+                'mgmt_ip': 'TEXT',
+                'device_type': 'TEXT',
+                'parent': 'TEXT',
+                'depth': 'INTEGER DEFAULT 0',
+                'platform': 'TEXT',
+                'capabilities': 'TEXT',
+                'priority': 'REAL DEFAULT 0',
+                'unreachable_reason': 'TEXT'
+            })
+            
+            # Connect and command latency histograms per host and per platform, for adaptive timeouts
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS latency_stats (
+                    scope TEXT,
+                    name TEXT,
+                    phase TEXT,
+                    count INTEGER,
+                    sum REAL,
+                    min REAL,
+                    max REAL,
+                    buckets TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (scope, name, phase)
+                )
+            ''')
+            
+            # The credential that last logged in to each host, so later visits try it first
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS host_credentials (
+                    hostname TEXT PRIMARY KEY,
+                    credential TEXT,
+                    site TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Credentials a host rejected during a crawl, so no worker offers them to it again
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS auth_failures (
+                    crawl_id TEXT,
+                    hostname TEXT,
+                    credential TEXT,
+                    failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (crawl_id, hostname, credential)
+                )
+            ''')
+            
+            # One row per crawl, so an interrupted crawl can be found and resumed
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_checkpoint (
+                    crawl_id TEXT PRIMARY KEY,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    config_hash TEXT,
+                    seed_device TEXT,
+                    run_id TEXT,
+                    status TEXT
                 )
             ''')
             
@@ -53,178 +312,469 @@ class DeviceDatabase:
             
             conn.commit()
 
+    def _set_queue_state(self, hostname: str, state: str, only_new: bool = False):
+        """Move a queue row between states in the in-memory counters"""
+        with self._queue_lock:
+            previous = self._queue_states.get(hostname)
+            if previous == state or (only_new and previous is not None):
+                return
+            if previous is not None:
+                self._queue_counts[previous] -= 1
+            self._queue_states[hostname] = state
+            self._queue_counts[state] += 1
+
+    def reconcile_queue_counts(self):
+        """Rebuild the in-memory queue counters from crawl_queue"""
+        self.flush()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT hostname,
+                       CASE WHEN processed = 1 THEN 'processed'
+                            WHEN processing = 1 THEN 'processing'
+                            ELSE 'pending' END
+                FROM crawl_queue
+            ''')
+            states = dict(cursor.fetchall())
+        with self._queue_lock:
+            self._queue_states = states
+            self._queue_counts = dict.fromkeys(QUEUE_STATES, 0)
+            for state in states.values():
+                self._queue_counts[state] += 1
+
+    @staticmethod
+    def _add_missing_columns(cursor, table: str, columns: Dict[str, str]):
+        """Add columns introduced after a database file was first created"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, column_type in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
     def add_device(self, device_info: Dict):
         """Add or update device information in the database"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # First check if device exists
-                cursor.execute('''
-                    SELECT 1 FROM devices WHERE hostname = ?
-                ''', (device_info.get('hostname'),))
-                
-                exists = cursor.fetchone() is not None
-                self.logger.info(f"Device {device_info.get('hostname')} exists in DB: {exists}")
-                
-                if exists:
-                    # Update existing device
-                    self.logger.info(f"Updating device {device_info.get('hostname')} in database")
-                    cursor.execute('''
-                        UPDATE devices SET
-                            ip = COALESCE(?, ip),
-                            serial_number = COALESCE(?, serial_number),
-                            platform = COALESCE(?, platform),
-                            device_type = COALESCE(?, device_type),
-                            last_crawled = ?
-                        WHERE hostname = ?
-                    ''', (
-                        device_info.get('ip'),
-                        device_info.get('serial_number'),
-                        device_info.get('platform'),
-                        device_info.get('device_type'),
-                        datetime.now(),
-                        device_info.get('hostname')
-                    ))
-                    self.logger.info(f"Successfully updated device: {device_info.get('hostname')}")
-                else:
-                    # Insert new device
-                    self.logger.info(f"Inserting new device {device_info.get('hostname')} into database")
-                    cursor.execute('''
-                        INSERT INTO devices (
-                            hostname, ip, serial_number, platform, device_type, last_crawled
-                        ) VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        device_info.get('hostname'),
-                        device_info.get('ip'),
-                        device_info.get('serial_number'),
-                        device_info.get('platform'),
-                        device_info.get('device_type'),
-                        datetime.now()
-                    ))
-                    self.logger.info(f"Successfully inserted new device: {device_info.get('hostname')}")
-                
-                conn.commit()
-                self.logger.info(f"Database commit successful for device: {device_info.get('hostname')}")
-        except sqlite3.Error as e:
-            self.logger.error(f"Database error for device {device_info.get('hostname')}: {str(e)}")
-            self.logger.error(f"Traceback: {traceback.format_exc()}")
-            raise
+        self.logger.debug(f"Queueing device {device_info.get('hostname')} for write")
+        self._writer.submit('''
+            INSERT INTO devices (
+                hostname, ip, serial_number, platform, device_type, last_crawled, neighbor_hash, depth
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(hostname) DO UPDATE SET
+                ip = COALESCE(excluded.ip, ip),
+                serial_number = COALESCE(excluded.serial_number, serial_number),
+                platform = COALESCE(excluded.platform, platform),
+                device_type = COALESCE(excluded.device_type, device_type),
+                last_crawled = excluded.last_crawled,
+                neighbor_hash = COALESCE(excluded.neighbor_hash, neighbor_hash),
+                depth = COALESCE(excluded.depth, depth)
+        ''', (
+            device_info.get('hostname'),
+            device_info.get('ip'),
+            device_info.get('serial_number'),
+            device_info.get('platform'),
+            device_info.get('device_type'),
+            datetime.now(),
+            device_info.get('neighbor_hash'),
+            device_info.get('depth')
+        ))
 
-    def add_to_queue(self, hostname: str):
-        """Add a device to the crawl queue"""
-        with sqlite3.connect(self.db_path) as conn:
+    def add_to_queue(self, hostname: str, mgmt_ip: str = None, device_type: str = None,
+                     parent: str = None, depth: int = 0, platform: str = None,
+                     capabilities: str = None, priority: float = 0, last_crawled: str = None):
+        """Add a device to the crawl queue with what its parent's CDP table reported"""
+        # last_crawled only feeds the scheduler, devices keeps the real value
+        self._set_queue_state(hostname, 'pending', only_new=True)
+        self._writer.submit('''
+            INSERT INTO crawl_queue (hostname, processed, mgmt_ip, device_type, parent, depth,
+                                     platform, capabilities, priority)
+            VALUES (?, 0, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(hostname) DO UPDATE SET
+                mgmt_ip = COALESCE(crawl_queue.mgmt_ip, excluded.mgmt_ip),
+                device_type = COALESCE(crawl_queue.device_type, excluded.device_type),
+                parent = COALESCE(crawl_queue.parent, excluded.parent),
+                depth = COALESCE(crawl_queue.depth, excluded.depth),
+                platform = COALESCE(crawl_queue.platform, excluded.platform),
+                capabilities = COALESCE(crawl_queue.capabilities, excluded.capabilities),
+                priority = excluded.priority
+        ''', (hostname, mgmt_ip, device_type, parent, depth, platform, capabilities, priority))
+
+    def claim_device(self, hostname: str, owner: str,
+                     lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Atomically claim a device for processing, returns False if another worker holds it"""
+        now = time.time()
+        with timings.span('db.claim'), self._get_connection() as conn:
+            self.lock_waits.begin_immediate(conn)
             cursor = conn.cursor()
             
-            # First check if device is already in queue
+            # Insert-or-claim in one statement so two workers can never both win,
+            # the queue metadata is filled in by add_to_queue if it lands after the claim
             cursor.execute('''
-                SELECT 1 FROM crawl_queue WHERE hostname = ?
-            ''', (hostname,))
+                INSERT INTO crawl_queue (hostname, processed, processing, lease_owner, lease_expires, depth)
+                VALUES (?, 0, 1, ?, ?, NULL)
+                ON CONFLICT(hostname) DO UPDATE SET
+                    processing = 1,
+                    lease_owner = excluded.lease_owner,
+                    lease_expires = excluded.lease_expires
+                WHERE processed = 0
+                  AND (processing = 0 OR lease_expires IS NULL OR lease_expires < ?)
+                RETURNING hostname
+            ''', (hostname, owner, now + lease_seconds, now))
             
-            if not cursor.fetchone():
-                cursor.execute('''
-                    INSERT INTO crawl_queue (hostname, processed)
-                    VALUES (?, 0)
-                ''', (hostname,))
-                conn.commit()
+            claimed = cursor.fetchone() is not None
+            conn.commit()
+        if claimed:
+            self._set_queue_state(hostname, 'processing')
+        return claimed
 
-    def get_next_device(self) -> str:
-        """Get the next unprocessed device from the queue that isn't being processed"""
-        with sqlite3.connect(self.db_path) as conn:
+    def claim_devices(self, owner: str, limit: int = 1,
+                      lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[str]:
+        """Atomically claim up to limit unprocessed devices, lowest priority score first"""
+        now = time.time()
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            # Take the write lock up front so the select and update are one unit
+            self.lock_waits.begin_immediate(conn)
+            cursor.execute('''
+                UPDATE crawl_queue
+                SET processing = 1,
+                    lease_owner = ?,
+                    lease_expires = ?
+                WHERE hostname IN (
+                    SELECT hostname FROM crawl_queue
+                    WHERE processed = 0
+                      AND (processing = 0 OR lease_expires IS NULL OR lease_expires < ?)
+                    ORDER BY priority ASC, added_at ASC
+                    LIMIT ?
+                )
+                RETURNING hostname
+            ''', (owner, now + lease_seconds, now, limit))
+            claimed = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+            for hostname in claimed:
+                self._set_queue_state(hostname, 'processing')
+            return claimed
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    def get_next_device(self, owner: str = None) -> str:
+        """Claim the next unprocessed device from the queue that isn't being processed"""
+        claimed = self.claim_devices(owner or 'unknown', limit=1)
+        return claimed[0] if claimed else None
+
+    def reclaim_leases(self, owner_prefix: str = None) -> int:
+        """Return expired claims to pending, plus any held by owners starting with owner_prefix"""
+        now = time.time()
+        self.flush()
+        with self._get_connection() as conn:
+            self.lock_waits.begin_immediate(conn)
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE crawl_queue
+                SET processing = 0,
+                    lease_owner = NULL,
+                    lease_expires = NULL
+                WHERE processed = 0
+                  AND processing = 1
+                  AND (lease_expires IS NULL OR lease_expires < ?
+                       OR (? IS NOT NULL AND lease_owner LIKE ? || '%'))
+            ''', (now, owner_prefix, owner_prefix))
+            reclaimed = cursor.rowcount
+            conn.commit()
+        self.reconcile_queue_counts()
+        return reclaimed
+
+    def get_pending_entries(self) -> List[Dict]:
+        """Get every unprocessed, unclaimed queue row as a frontier entry, in priority order"""
+        self.flush()
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             
-            # Get the oldest unprocessed and not processing device
             cursor.execute('''
-                SELECT hostname FROM crawl_queue
+                SELECT hostname, mgmt_ip, device_type, parent, depth, platform, capabilities, priority
+                FROM crawl_queue
                 WHERE processed = 0 AND processing = 0
-                ORDER BY added_at ASC
-                LIMIT 1
+                ORDER BY priority ASC, added_at ASC
             ''')
             
-            result = cursor.fetchone()
-            if result:
-                # Mark as processing
+            return [
+                {'hostname': hostname, 'mgmt_ip': mgmt_ip, 'device_type': device_type,
+                 'parent': parent, 'depth': depth or 0, 'platform': platform,
+                 'capabilities': capabilities, 'priority': priority or 0}
+                for hostname, mgmt_ip, device_type, parent, depth, platform, capabilities, priority
+                in cursor.fetchall()
+            ]
+
+    def save_checkpoint(self, crawl_id: str, config_hash: str, seed_device: str,
+                        run_id: str, status: str = 'running'):
+        """Record a crawl starting or resuming, keeping its original start time"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO crawl_checkpoint (crawl_id, config_hash, seed_device, run_id, status)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(crawl_id) DO UPDATE SET
+                    updated_at = CURRENT_TIMESTAMP,
+                    config_hash = excluded.config_hash,
+                    run_id = excluded.run_id,
+                    status = excluded.status
+            ''', (crawl_id, config_hash, seed_device, run_id, status))
+            conn.commit()
+
+    def set_checkpoint_status(self, crawl_id: str, status: str):
+        """Update a crawl's status, e.g. to stopped or finished"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE crawl_checkpoint
+                SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE crawl_id = ?
+            ''', (status, crawl_id))
+            conn.commit()
+
+    def get_checkpoint(self, crawl_id: str = None) -> Dict:
+        """Get a crawl's checkpoint, or the most recent unfinished one when crawl_id is None"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            if crawl_id:
+                cursor.execute('SELECT * FROM crawl_checkpoint WHERE crawl_id = ?', (crawl_id,))
+            else:
                 cursor.execute('''
-                    UPDATE crawl_queue
-                    SET processing = 1
-                    WHERE hostname = ?
-                ''', (result[0],))
-                conn.commit()
-                return result[0]
-            return None
+                    SELECT * FROM crawl_checkpoint
+                    WHERE status != 'finished'
+                    ORDER BY started_at DESC, rowid DESC
+                    LIMIT 1
+                ''')
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([description[0] for description in cursor.description], row))
 
     def mark_processed(self, hostname: str):
         """Mark a device as processed in the queue"""
-        with sqlite3.connect(self.db_path) as conn:
+        self._set_queue_state(hostname, 'processed')
+        self._writer.submit('''
+            UPDATE crawl_queue
+            SET processed = 1,
+                processing = 0,
+                lease_owner = NULL,
+                lease_expires = NULL
+            WHERE hostname = ?
+        ''', (hostname,))
+
+    def mark_unreachable(self, hostname: str, reason: str):
+        """Close a queued device that failed its TCP pre-scan, so it is not retried this crawl"""
+        self._set_queue_state(hostname, 'processed')
+        self._writer.submit('''
+            UPDATE crawl_queue
+            SET processed = 1,
+                processing = 0,
+                lease_owner = NULL,
+                lease_expires = NULL,
+                unreachable_reason = ?
+            WHERE hostname = ?
+        ''', (reason, hostname))
+
+    def release_device(self, hostname: str):
+        """Release a device from processing state if something went wrong"""
+        self._set_queue_state(hostname, 'pending')
+        self._writer.submit('''
+            UPDATE crawl_queue
+            SET processing = 0,
+                lease_owner = NULL,
+                lease_expires = NULL
+            WHERE hostname = ?
+        ''', (hostname,))
+
+    def is_device_known(self, hostname: str, fresh_since: datetime = None) -> bool:
+        """Check if a device exists in the database, crawled at or after fresh_since if given"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            if fresh_since is None:
+                cursor.execute('''
+                    SELECT 1 FROM devices
+                    WHERE hostname = ?
+                ''', (hostname,))
+            else:
+                cursor.execute('''
+                    SELECT 1 FROM devices
+                    WHERE hostname = ? AND last_crawled >= ?
+                ''', (hostname, fresh_since))
+            
+            return cursor.fetchone() is not None
+
+    def get_stale_devices(self, crawled_before: datetime) -> List[Dict]:
+        """Get devices last crawled before the cutoff as frontier entries, stalest first"""
+        self.flush()
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
-                UPDATE crawl_queue
-                SET processed = 1,
-                    processing = 0
-                WHERE hostname = ?
-            ''', (hostname,))
+                SELECT hostname, ip, device_type, platform, last_crawled, depth FROM devices
+                WHERE last_crawled IS NULL OR last_crawled < ?
+                ORDER BY last_crawled ASC
+            ''', (crawled_before,))
             
-            conn.commit()
+            return [
+                {'hostname': hostname, 'mgmt_ip': ip or None, 'device_type': device_type,
+                 'parent': None, 'depth': depth or 0, 'platform': platform, 'last_crawled': last_crawled}
+                for hostname, ip, device_type, platform, last_crawled, depth in cursor.fetchall()
+            ]
 
-    def release_device(self, hostname: str):
-        """Release a device from processing state if something went wrong"""
-        with sqlite3.connect(self.db_path) as conn:
+    def save_latency_stats(self, rows: List[Dict]):
+        """Store latency histograms, each row replaces the stored one for its scope, name and phase"""
+        for row in rows:
+            self._writer.submit('''
+                INSERT INTO latency_stats (scope, name, phase, count, sum, min, max, buckets, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(scope, name, phase) DO UPDATE SET
+                    count = excluded.count,
+                    sum = excluded.sum,
+                    min = excluded.min,
+                    max = excluded.max,
+                    buckets = excluded.buckets,
+                    updated_at = excluded.updated_at
+            ''', (row['scope'], row['name'], row['phase'], row['count'], row['sum'],
+                  row['min'], row['max'], json.dumps(row['buckets'])))
+
+    def get_latency_stats(self) -> List[Dict]:
+        """Get every stored latency histogram"""
+        self.flush()
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
-                UPDATE crawl_queue
-                SET processing = 0
-                WHERE hostname = ?
-            ''', (hostname,))
+                SELECT scope, name, phase, count, sum, min, max, buckets FROM latency_stats
+            ''')
             
-            conn.commit()
+            return [
+                {'scope': scope, 'name': name, 'phase': phase, 'count': count, 'sum': total,
+                 'min': minimum, 'max': maximum, 'buckets': json.loads(buckets)}
+                for scope, name, phase, count, total, minimum, maximum, buckets in cursor.fetchall()
+            ]
 
-    def is_device_known(self, hostname: str) -> bool:
-        """Check if a device exists in the database"""
-        with sqlite3.connect(self.db_path) as conn:
+    def save_host_credential(self, hostname: str, credential: str, site: str = None):
+        """Store the name of the credential a host accepted"""
+        self._writer.submit('''
+            INSERT INTO host_credentials (hostname, credential, site, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(hostname) DO UPDATE SET
+                credential = excluded.credential,
+                site = excluded.site,
+                updated_at = excluded.updated_at
+        ''', (hostname, credential, site))
+
+    def get_host_credentials(self) -> List[Dict]:
+        """Get the credential each host last accepted, oldest first"""
+        self.flush()
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT 1 FROM devices
+                SELECT hostname, credential, site FROM host_credentials ORDER BY updated_at ASC
+            ''')
+            
+            return [
+                {'hostname': hostname, 'credential': credential, 'site': site}
+                for hostname, credential, site in cursor.fetchall()
+            ]
+
+    def record_auth_failure(self, crawl_id: str, hostname: str, credential: str):
+        """Store that a host rejected a credential during a crawl"""
+        self._writer.submit('''
+            INSERT OR IGNORE INTO auth_failures (crawl_id, hostname, credential)
+            VALUES (?, ?, ?)
+        ''', (crawl_id, hostname, credential))
+
+    def get_auth_failures(self, crawl_id: str) -> List[Dict]:
+        """Get the credentials hosts rejected during a crawl"""
+        self.flush()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT hostname, credential FROM auth_failures WHERE crawl_id = ?
+            ''', (crawl_id,))
+            
+            return [{'hostname': hostname, 'credential': credential} for hostname, credential in cursor.fetchall()]
+
+    def get_neighbor_hash(self, hostname: str) -> str:
+        """Get the neighbour set hash recorded when a device was last crawled"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT neighbor_hash FROM devices
                 WHERE hostname = ?
             ''', (hostname,))
             
-            return cursor.fetchone() is not None
+            result = cursor.fetchone()
+            return result[0] if result else None
 
-    def get_queue_status(self) -> Dict:
-        """Get current status of the crawl queue"""
-        with sqlite3.connect(self.db_path) as conn:
+    def get_device_type(self, hostname: str) -> str:
+        """Get the device type recorded for a device by a previous crawl"""
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             
-            # Get total count
-            cursor.execute('SELECT COUNT(*) FROM crawl_queue')
-            total = cursor.fetchone()[0]
+            cursor.execute('''
+                SELECT device_type FROM devices
+                WHERE hostname = ?
+            ''', (hostname,))
             
-            # Get pending count
-            cursor.execute('SELECT COUNT(*) FROM crawl_queue WHERE processed = 0')
-            pending = cursor.fetchone()[0]
+            result = cursor.fetchone()
+            return result[0] if result else None
+
+    def get_known_hostnames(self) -> List[str]:
+        """Get every hostname recorded as a device or in the crawl queue"""
+        self.flush()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
             
-            # Get processed count
-            cursor.execute('SELECT COUNT(*) FROM crawl_queue WHERE processed = 1')
-            processed = cursor.fetchone()[0]
+            cursor.execute('''
+                SELECT hostname FROM devices
+                UNION
+                SELECT hostname FROM crawl_queue
+            ''')
             
-            return {
-                'total': total,
-                'pending': pending,
-                'processed': processed
-            }
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_queued_hostnames(self) -> List[str]:
+        """Get every hostname in the crawl queue"""
+        self.flush()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT hostname FROM crawl_queue')
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_queue_status(self, refresh: bool = False) -> Dict:
+        """Get current status of the crawl queue from the in-memory counters"""
+        if refresh:
+            self.reconcile_queue_counts()
+        with self._queue_lock:
+            counts = dict(self._queue_counts)
+        return {
+            'total': sum(counts.values()),
+            'pending': counts['pending'] + counts['processing'],
+            'processing': counts['processing'],
+            'processed': counts['processed']
+        }
 
     def clear_queue(self):
         """Clear the queue table"""
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM crawl_queue')
             conn.commit()
+        with self._queue_lock:
+            self._queue_states = {}
+            self._queue_counts = dict.fromkeys(QUEUE_STATES, 0)
 
     def export_to_csv(self, output_path: str):
         """Export device information to CSV"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             
             # Get all devices with their information
@@ -259,7 +809,7 @@ class DeviceDatabase:
     def acquire_connection(self, hostname: str, worker_id: str) -> bool:
         """Attempt to acquire a connection lock for a device"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._get_connection() as conn:
                 cursor = conn.cursor()
                 
                 # Try to insert the connection record
@@ -280,7 +830,7 @@ class DeviceDatabase:
     def release_connection(self, hostname: str, worker_id: str):
         """Release a connection lock for a device"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._get_connection() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -294,7 +844,7 @@ class DeviceDatabase:
 
     def is_device_connected(self, hostname: str) -> bool:
         """Check if a device is currently connected by any worker"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1,6 +1,10 @@
 from typing import Dict, List
 from connect import DeviceConnection
+from credentials import CredentialChain
+from metrics import metrics
+from reachability import tcp_probe
 from parser import CommandParser
+from timing import timings
 import re
 import logging
 import traceback
@@ -8,17 +12,34 @@ from datetime import datetime
 import threading
 
 class NetworkDevice:
+    # Every command a visit runs, so engines can fetch them before parsing
+    VISIT_COMMANDS = ('show cdp neighbors detail', 'show version')
+
     def __init__(self, hostname: str, username: str, password: str, device_type: str = 'cisco_ios', 
-                 mgmt_ip: str = None, worker_id: str = None):
+                 mgmt_ip: str = None, worker_id: str = None, detect_type: bool = True, port: int = 22,
+                 session_profile: str = 'fast', connect_timeout: float = 20, command_timeout: float = None,
+                 precheck_timeout: float = None, credentials: CredentialChain = None):
         self.hostname = self.clean_hostname(hostname)
         self.mgmt_ip = mgmt_ip  # Add management IP as fallback
         self.username = username
         self.password = password
+        self.port = port
+        # Logins to try in order, shared by every visit so they learn from each other
+        self.credentials = credentials if credentials is not None else CredentialChain(
+            [{'username': username, 'password': password}])
+        self.credential = None  # The credential the device accepted
+        self.session_profile = session_profile  # netmiko profile, see connect.SESSION_PROFILES
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout  # None keeps the session profile's read timeouts
+        self.precheck_timeout = precheck_timeout  # TCP check before SSH, None to go straight to SSH
+        self.latencies = []  # (phase, seconds) observed by every connection this visit
         self.device_type = device_type
+        self.detect_type = detect_type  # False when device_type is already known, e.g. from a previous crawl
         self.connection = None
         self.parser = CommandParser()
         self.worker_id = worker_id or str(threading.get_ident())  # Use thread ID as worker ID if not provided
         self.platform_info = {}  # Store platform-specific information
+        self._parsed_cdp = None  # (device_type, parsed neighbours) shared by one visit
         
         # Configure logging
         self.logger = logging.getLogger(__name__)
@@ -99,37 +120,52 @@ class NetworkDevice:
         return None
 
     def connect(self):
-        """Establish connection to the device, trying hostname first then mgmt IP"""
-        self.logger.info(f"Attempting to connect to {self.hostname}")
-        
-        # First try with the provided device type
-        self.connection = DeviceConnection(
-            hostname=self.hostname,
-            username=self.username,
-            password=self.password,
-            device_type=self.device_type
-        )
-    
-        # Trye to connect to main if not connect try mgmt fall back
-        if not self.connection.connect():
-            self.logger.warning(f"Failed to connect to {self.hostname}: {str(e)}")
-            if not self.mgmt_ip:  # If no mgmt IP available, raise the original error
-                return
-            
-            self.logger.debug(f"Trying fallback connection with mgmt IP: {self.mgmt_ip}")
-            self.connection = DeviceConnection(
-                hostname=self.mgmt_ip,  # Use IP instead of hostname
-                username=self.username,
-                password=self.password,
-                device_type=self.device_type
-            )
-            if not self.connection.connect():
-                self.logger.error("Failed fallback")    
-            self.logger.info(f"Successfully connected to {self.hostname} as {self.device_type}")
-            return
+        """Establish connection to the device, trying mgmt IP first then hostname"""
+        # The CDP management IP skips DNS, which often fails for site-xx-xx short names
+        targets = [target for target in (self.mgmt_ip, self.hostname) if target]
+        with timings.span('device.connect'):
+            for target in dict.fromkeys(targets):
+                if self.precheck_timeout and not self._is_reachable(target):
+                    continue
+                candidates = self.credentials.candidates(self.hostname)
+                if not candidates:
+                    self.logger.warning(f"{self.hostname} already rejected every credential, not logging in again")
+                    break
+                for credential in candidates:
+                    self.logger.info(f"Attempting to connect to {self.hostname} via {target} as {credential['name']}")
+                    self.connection = DeviceConnection(
+                        hostname=target,
+                        username=credential['username'],
+                        password=credential['password'],
+                        device_type=self.device_type,
+                        port=self.port,
+                        session_profile=self.session_profile,
+                        connect_timeout=self.connect_timeout,
+                        read_timeout=self.command_timeout,
+                        latencies=self.latencies
+                    )
+                    if self.connection.connect():
+                        self.credentials.succeeded(self.hostname, credential)
+                        self.credential = credential
+                        self.logger.info(f"Successfully connected to {self.hostname} via {target} as {self.device_type}")
+                        return
+                    if self.connection.last_error != 'auth':
+                        break  # Only a rejected login is worth retrying with the next credential
+                    self.credentials.failed(self.hostname, credential)
+                self.logger.warning(f"Failed to connect to {self.hostname} via {target}")
 
-        self.logger.info(f"Successfully connected to {self.mgmt_ip}")
-        return
+            self.connection = None
+            raise ConnectionError(f"Could not connect to {self.hostname} via {', '.join(targets)}")
+
+    def _is_reachable(self, target: str) -> bool:
+        """TCP pre-check, so a dead address fails in milliseconds instead of after the SSH timeout"""
+        with timings.span('tcp.precheck'):
+            reason = tcp_probe(target, self.port, self.precheck_timeout)
+        if reason is None:
+            return True
+        self.logger.warning(f"Skipping {self.hostname} via {target}, TCP port {self.port} {reason}")
+        metrics.connect_failed('unreachable')
+        return False
 
     def disconnect(self) -> None:
         """Close the device connection"""
@@ -139,14 +175,14 @@ class NetworkDevice:
             self.connection = None
             self.logger.info(f"Disconnected from {self.hostname}")
 
-    def send_command(self, command: str) -> str:
+    def send_command(self, command: str, use_cache: bool = True) -> str:
         """Send a command to the device and return the output"""
         if not self.connection:
             raise RuntimeError("Not connected to device")
             
         self.logger.debug(f"Sending command to {self.hostname}: {command}")
         try:
-            output = self.connection.send_command(command)
+            output = self.connection.send_command(command, use_cache=use_cache)
             if "Invalid input" in output or "Incomplete command" in output:
                 raise ValueError(f"Invalid command: {command}")
             self.logger.debug(f"Command output length: {len(output)} characters")
@@ -156,34 +192,42 @@ class NetworkDevice:
             self.logger.error(f"Traceback: {traceback.format_exc()}")
             raise
 
+    def prefetch(self, commands=VISIT_COMMANDS):
+        """Fetch a visit's commands in one batch, later send_command calls are served from the session cache"""
+        if not self.connection:
+            raise RuntimeError("Not connected to device")
+        try:
+            with timings.span('device.prefetch'):
+                self.connection.send_commands(list(commands))
+        except Exception as e:
+            # Each command is sent again on its own when the visit asks for it
+            self.logger.warning(f"Batched fetch failed for {self.hostname}, sending commands one at a time: {str(e)}")
+
+    def _get_parsed_cdp(self) -> List[Dict]:
+        """Run and parse show cdp neighbors detail once per visit, returning fresh copies"""
+        if self._parsed_cdp is None or self._parsed_cdp[0] != self.device_type:
+            show_cdp = self.send_command('show cdp neighbors detail')
+            self.logger.debug(f"Parsing CDP neighbors output for {self.hostname}")
+            self._parsed_cdp = (self.device_type, self.parser.parse_cdp_neighbors(show_cdp, self.device_type))
+        # Callers pop fields off the entries, so hand out copies
+        return [dict(neighbor) for neighbor in self._parsed_cdp[1]]
+
     def get_device_info(self) -> Dict:
         """Get basic device information"""
         self.logger.info(f"Getting device info from {self.hostname}")
         try:
-            # First try to get CDP info to detect device type
-            try:
-                show_cdp = self.send_command('show cdp neighbors detail')
-                cdp_info = self.parser.parse_cdp_neighbors(show_cdp, self.device_type)
-                if cdp_info:
-                    # Use the first neighbor's info to detect device type
-                    first_neighbor = cdp_info[0]
-                    platform = first_neighbor.get('PLATFORM', '')
-                    version = first_neighbor.get('NEIGHBOR_DESCRIPTION', '')
-                    cdp_info_str = f"{platform} {version}"
-                    detected_type = self.detect_device_type_from_cdp(cdp_info_str)
-                    if detected_type and detected_type != self.device_type:
-                        self.logger.info(f"Detected {detected_type} from CDP, reconnecting with correct type")
-                        self.device_type = detected_type
-                        # Reconnect with correct type
-                        self.disconnect()
-                        self.connect()
-            except Exception as e:
-                self.logger.warning(f"Failed to get CDP info: {str(e)}")
-                # Continue with current device type if CDP fails
-            
             # Get version info which includes serial and model
             show_version = self.send_command('show version')
             
+            # show version describes this device itself, unlike the CDP table which describes its neighbours
+            if self.detect_type:
+                detected_type = self.detect_device_type(show_version)
+                if detected_type != self.device_type:
+                    self.logger.info(f"Detected {detected_type} from show version, switching command profile")
+                    self.device_type = detected_type
+                    # Keep the live session, only the prompt handling and templates change
+                    self.connection.set_command_profile(detected_type)
+            
             # Parse based on device type using appropriate template
             version_info = self.parser.parse_show_version(show_version, self.device_type)
             
@@ -242,9 +286,7 @@ class NetworkDevice:
         """Get CDP neighbor information"""
         self.logger.info(f"Getting CDP neighbors from {self.hostname}")
         try:
-            show_cdp = self.send_command('show cdp neighbors detail')
-            self.logger.debug(f"Parsing CDP neighbors output for {self.hostname}")
-            neighbors = self.parser.parse_cdp_neighbors(show_cdp, self.device_type)
+            neighbors = self._get_parsed_cdp()
             processed_neighbors = []
             
             for neighbor in neighbors:
@@ -0,0 +1,148 @@
+import fnmatch
+import ipaddress
+import re
+from typing import Iterable
+import logging
+
+# Marks the end of a domain in the suffix trie
+_END = ''
+
+# Regex syntax whose meaning depends on the rest of the pattern: inline flags, named groups and
+# their references, conditionals, and numbered backreferences or octal escapes. Rules using it
+# are not joined into the shared alternation. An escaped backslash before a digit also matches,
+# which only costs that rule its own search.
+_UNJOINABLE = re.compile(r'\(\?(?![:=!]|<[=!])|\\\d')
+
+
+class HostFilter:
+    """Compiled exclude/include rules for hostnames and management addresses.
+
+    Rules are compiled once. Exact names, domains and networks cost about the
+    same per lookup with thousands of them as with a handful, while globs and
+    regexes are joined so each kind takes one search however many there are:
+      - site-01-01             exact name, matched through a set
+      - stephen.com            dotted name, also matches every host in that domain
+      - .stephen.com           only hosts inside the domain
+      - site-01-*  / sw-??     glob, all globs share one compiled regex
+      - re:^site-0[1-5]-       regex searched in the name, all plain regexes share one
+                               compiled alternation, those using inline flags, group
+                               references or conditionals are searched on their own
+      - 10.20.0.0/16 / 10.1.1.1  CIDR or address, matched against management IPs
+    Names are matched case-insensitively. A regex that does not compile
+    raises ValueError naming the rule.
+    """
+
+    def __init__(self, rules: Iterable[str] = None):
+        # An empty YAML list item arrives as None, skip it rather than matching a host called "None"
+        self.rules = [str(rule).strip() for rule in rules or [] if rule is not None and str(rule).strip()]
+        self._exact = set()
+        self._suffixes = {}
+        self._networks = {}  # (version, prefix length) -> set of network addresses as ints
+        self._regexes = []  # Regexes that only work in their own pattern, searched one by one
+        globs = []
+        joinable = []
+
+        for rule in self.rules:
+            if rule.startswith('re:'):
+                # Compile on its own first so an invalid rule is named rather than the joined pattern
+                try:
+                    regex = re.compile(rule[3:], re.I)
+                except re.error as e:
+                    raise ValueError(f"Invalid regex in filter rule '{rule}': {str(e)}") from e
+                if _UNJOINABLE.search(regex.pattern):
+                    self._regexes.append(regex)
+                else:
+                    joinable.append(regex.pattern)
+                continue
+            network = self._parse_network(rule)
+            if network is not None:
+                key = (network.version, network.prefixlen)
+                self._networks.setdefault(key, set()).add(int(network.network_address))
+                continue
+            rule = rule.lower()
+            if any(char in rule for char in '*?['):
+                globs.append(fnmatch.translate(rule))
+            elif rule.startswith('.'):
+                self._add_suffix(rule[1:], include_self=False)
+            elif '.' in rule:
+                self._add_suffix(rule, include_self=True)
+            else:
+                self._exact.add(rule)
+
+        self._glob = re.compile('|'.join(f'(?:{pattern})' for pattern in globs)) if globs else None
+        if joinable:
+            self._regexes.insert(0, re.compile('|'.join(f'(?:{pattern})' for pattern in joinable), re.I))
+        self.logger = logging.getLogger(__name__)
+        if self.rules:
+            self.logger.debug(f"Compiled {len(self.rules)} filter rules: {len(self._exact)} exact, "
+                              f"{len(globs)} globs, {len(joinable)} joined and {len(self._regexes) - bool(joinable)} separate regexes, "
+                              f"{sum(len(nets) for nets in self._networks.values())} networks")
+
+    @staticmethod
+    def _parse_network(rule: str):
+        """Parse an address or CIDR rule, None for anything else"""
+        if not (rule[0].isdigit() or ':' in rule):
+            return None
+        try:
+            return ipaddress.ip_network(rule, strict=False)
+        except ValueError:
+            return None
+
+    def _add_suffix(self, domain: str, include_self: bool):
+        # Labels are stored last first, so a lookup walks a name from its TLD down
+        node = self._suffixes
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        # True matches the domain itself as well as its hosts, False only hosts below it
+        node[_END] = node.get(_END, False) or include_self
+
+    def _matches_suffix(self, name: str) -> bool:
+        node = self._suffixes
+        labels = name.split('.')
+        for index in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[index])
+            if node is None:
+                return False
+            if _END in node and (index > 0 or node[_END]):
+                return True
+        return False
+
+    def _matches_address(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        value = int(ip)
+        bits = ip.max_prefixlen
+        for (version, prefixlen), networks in self._networks.items():
+            if version == ip.version and (value >> (bits - prefixlen)) << (bits - prefixlen) in networks:
+                return True
+        return False
+
+    def _matches_name(self, name: str) -> bool:
+        name = name.lower()
+        if name in self._exact:
+            return True
+        if self._suffixes and self._matches_suffix(name):
+            return True
+        if self._glob is not None and self._glob.match(name):
+            return True
+        return any(regex.search(name) for regex in self._regexes)
+
+    def matches(self, *names: str, ip: str = None) -> bool:
+        """Check if any of a device's names, or its management IP, matches a rule"""
+        for name in names:
+            if not name:
+                continue
+            if self._matches_name(name):
+                return True
+            # A device known only by its address, such as an IP seed, is matched against the networks too
+            if self._networks and (name[0].isdigit() or ':' in name) and self._matches_address(name):
+                return True
+        return bool(ip and self._networks and self._matches_address(ip))
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
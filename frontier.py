@@ -0,0 +1,136 @@
+import heapq
+import itertools
+import re
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+
+# CDP capability keywords and how much earlier (negative) or later they are visited
+CAPABILITY_SCORES = (
+    ('Router', -3.0),
+    ('Switch', -2.0),
+    ('Phone', 4.0),
+    ('Host', 3.0),
+    ('Trans-Bridge', 3.0),
+)
+
+# Platform patterns, backbone hardware first, access points last
+PLATFORM_SCORES = (
+    (re.compile(r'N[3579]K|Nexus', re.I), -2.0),
+    (re.compile(r'C9[56]\d\d|C6[58]\d\d|ASR|ISR|C8[35]\d\d', re.I), -1.5),
+    (re.compile(r'AIR-|C91\d\dAX', re.I), 3.0),
+)
+
+
+class FifoScheduler:
+    """Visits entries in the order they were queued"""
+
+    def score(self, entry: Dict) -> float:
+        return 0.0
+
+
+class PriorityScheduler:
+    """Scores entries so backbone devices are visited first, lower scores go first.
+
+    Each hop of depth adds depth_weight. Router/switch capabilities and
+    core or distribution platforms subtract, hosts and APs add, and a
+    device last crawled a while ago gains up to staleness_weight as its age
+    approaches staleness_horizon_days.
+    """
+
+    def __init__(self, depth_weight: float = 1.0, role_weight: float = 1.0, platform_weight: float = 1.0,
+                 staleness_weight: float = 2.0, staleness_horizon_days: float = 30):
+        self.depth_weight = depth_weight
+        self.role_weight = role_weight
+        self.platform_weight = platform_weight
+        self.staleness_weight = staleness_weight
+        self.staleness_horizon_days = staleness_horizon_days
+
+    def score(self, entry: Dict) -> float:
+        score = self.depth_weight * (entry.get('depth') or 0)
+
+        capabilities = entry.get('capabilities') or ''
+        for keyword, value in CAPABILITY_SCORES:
+            if keyword in capabilities:
+                score += self.role_weight * value
+                break
+
+        platform = entry.get('platform') or ''
+        for pattern, value in PLATFORM_SCORES:
+            if pattern.search(platform):
+                score += self.platform_weight * value
+                break
+
+        last_crawled = entry.get('last_crawled')
+        if last_crawled:
+            if isinstance(last_crawled, str):
+                last_crawled = datetime.fromisoformat(last_crawled)
+            age_days = (datetime.now() - last_crawled).total_seconds() / 86400
+            score -= self.staleness_weight * min(max(age_days, 0) / self.staleness_horizon_days, 1.0)
+        return score
+
+
+SCHEDULERS = {
+    'fifo': FifoScheduler,
+    'priority': PriorityScheduler,
+}
+
+
+class Frontier:
+    """In-memory crawl frontier that idle workers block on.
+
+    SQLite stays the durable copy of the queue; this only handles dispatch,
+    so an idle worker sleeps on a condition variable until a neighbour is
+    queued instead of polling the database. Entries come out lowest
+    'priority' first, ties in the order they were queued.
+    """
+
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler or FifoScheduler()
+        self._items = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.logger = logging.getLogger(__name__)
+
+    def prioritise(self, entry: Dict) -> Dict:
+        """Score an entry with the scheduler unless it already carries a priority"""
+        if entry.get('priority') is None:
+            entry['priority'] = self.scheduler.score(entry)
+        return entry
+
+    def put(self, entry: Dict) -> bool:
+        """Queue a device entry, returns False if the frontier is closed"""
+        self.prioritise(entry)
+        with self._cond:
+            if self._closed:
+                return False
+            heapq.heappush(self._items, (entry['priority'], next(self._sequence), entry))
+            self._cond.notify()
+            return True
+
+    def get(self, timeout: float = None) -> Optional[Dict]:
+        """Block until a device entry is available, returns None on timeout or close"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if not self._items:
+                return None
+            return heapq.heappop(self._items)[2]
+
+    def close(self):
+        """Wake every waiting worker so it can exit"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reset(self):
+        """Drop all queued entries and reopen the frontier"""
+        with self._cond:
+            self._items.clear()
+            self._closed = False
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._items)
@@ -1,4 +1,5 @@
 import argparse
+import os
 import yaml
 import sys
 from rich.console import Console
@@ -28,6 +29,16 @@ def load_config(config_path: str) -> dict:
                 if field not in config['credentials']:
                     raise ValueError(f"Missing required credential field: {field}")
             
+            # Fallback accounts are tried in order when a device rejects the one above
+            for credential in config['credentials'].get('fallback') or []:
+                for field in required_credentials:
+                    if field not in credential:
+                        raise ValueError(f"Missing required field in fallback credential: {field}")
+            
+            engine = config.get('settings', {}).get('engine', 'threads')
+            if engine not in ('threads', 'async'):
+                raise ValueError(f"Unknown engine: {engine} (use threads or async)")
+            
             return config
     except Exception as e:
         console.print(f"[red]Error loading config: {str(e)}[/red]")
@@ -43,6 +54,7 @@ def show_status(crawler: NetworkCrawler):
     
     table.add_row("Total Devices", str(status['total']))
     table.add_row("Pending", str(status['pending']))
+    table.add_row("Processing", str(status['processing']))
     table.add_row("Processed", str(status['processed']))
     
     console.print(table)
@@ -50,6 +62,8 @@ def show_status(crawler: NetworkCrawler):
 def main():
     parser = argparse.ArgumentParser(description="Network Device Crawler")
     parser.add_argument("--config", default="config.yaml", help="Path to configuration file")
+    parser.add_argument("--resume", nargs="?", const="latest", metavar="CRAWL_ID",
+                        help="Resume an interrupted crawl, the latest unfinished one unless CRAWL_ID is given")
     args = parser.parse_args()
     
     # Load configuration
@@ -61,10 +75,30 @@ def main():
         username=config['credentials']['username'],
         password=config['credentials']['password'],
         device_type=config['credentials'].get('device_type', 'cisco_ios'),
-        max_workers=config.get('settings', {}).get('max_depth', 5),
+        engine=config.get('settings', {}).get('engine', 'threads'),
+        port=config.get('settings', {}).get('port', 22),
+        max_workers=config.get('settings', {}).get('max_workers', 5),
+        max_depth=config.get('settings', {}).get('max_depth'),
+        max_per_site=config.get('settings', {}).get('max_per_site'),
+        max_per_parent=config.get('settings', {}).get('max_per_parent'),
         db_path='network_devices.db',  # Default path
+        use_bloom=config.get('settings', {}).get('use_bloom', False),
         exclude_hosts=config.get('settings', {}).get('exclude_hosts', []),
-        include_only=config.get('settings', {}).get('include_only', [])
+        include_only=config.get('settings', {}).get('include_only', []),
+        metrics_port=config.get('settings', {}).get('metrics_port'),
+        resume=bool(args.resume) or config.get('settings', {}).get('resume', False),
+        crawl_id=args.resume if args.resume not in (None, 'latest') else None,
+        recrawl_ttl_hours=config.get('settings', {}).get('recrawl_ttl_hours'),
+        scheduler=config.get('settings', {}).get('scheduler', 'priority'),
+        session_profile=config.get('settings', {}).get('session_profile', 'fast'),
+        connect_timeout=config.get('settings', {}).get('timeout', 20),
+        adaptive_timeouts=config.get('settings', {}).get('adaptive_timeouts', True),
+        timeout_margin=config.get('settings', {}).get('timeout_margin', 3.0),
+        tcp_precheck_timeout=config.get('settings', {}).get('tcp_precheck_timeout', 1.0),
+        prescan=config.get('settings', {}).get('prescan', True),
+        prescan_concurrency=config.get('settings', {}).get('prescan_concurrency', 256),
+        batch_commands=config.get('settings', {}).get('batch_commands', True),
+        fallback_credentials=config['credentials'].get('fallback') or []
     )
     
     # Main menu loop
@@ -88,6 +122,9 @@ def main():
             output_path = Prompt.ask("Enter output file path", default="network_inventory.csv")
             crawler.export_results(output_path)
             console.print(f"[green]Results exported to {output_path}[/green]")
+            timings_path = f"{os.path.splitext(output_path)[0]}_timings.json"
+            crawler.export_timings(timings_path)
+            console.print(f"[green]Phase timings exported to {timings_path}[/green]")
             
         elif choice == "4":
             console.print("[yellow]Exiting...[/yellow]")
@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+from timing import timings
+
+# Span name -> (metric name, label the span's label is exported under)
+SPAN_METRICS = {
+    'ssh.command': ('crawler_command_duration_seconds', 'command'),
+    'ssh.connect': ('crawler_ssh_connect_duration_seconds', None),
+    'parse': ('crawler_parse_duration_seconds', 'template'),
+    'db.commit': ('crawler_sqlite_write_duration_seconds', None),
+    'db.claim': ('crawler_sqlite_claim_duration_seconds', None),
+    'db.lock_wait': ('crawler_sqlite_lock_wait_seconds', None),
+}
+
+# Window used for the devices/sec gauge
+RATE_WINDOW_SECONDS = 60
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class CrawlMetrics:
+    """Counters and gauges for a running crawl, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.active_sessions = 0
+            self.devices_processed = 0
+            self.connect_failures = {}
+            self.skipped = {}
+            self.session_fallbacks = 0
+            self.unreachable = {}
+            self._completions = deque()
+
+    def session_opened(self):
+        with self._lock:
+            self.active_sessions += 1
+
+    def session_closed(self):
+        with self._lock:
+            self.active_sessions = max(self.active_sessions - 1, 0)
+
+    def connect_failed(self, reason: str):
+        """Count a failed SSH login, reason is e.g. timeout, auth or refused"""
+        with self._lock:
+            self.connect_failures[reason] = self.connect_failures.get(reason, 0) + 1
+
+    def device_unreachable(self, reason: str):
+        """Count a device the TCP pre-scan ruled out, reason is timeout, refused or unreachable"""
+        with self._lock:
+            self.unreachable[reason] = self.unreachable.get(reason, 0) + 1
+
+    def session_fallback(self):
+        """Count a host that needed the conservative SSH session profile"""
+        with self._lock:
+            self.session_fallbacks += 1
+
+    def devices_skipped(self, reason: str, count: int = 1):
+        """Count neighbours left unqueued by a crawl limit, reason is max_depth, max_per_site or max_per_parent"""
+        with self._lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + count
+
+    def device_processed(self):
+        now = time.monotonic()
+        with self._lock:
+            self.devices_processed += 1
+            self._completions.append(now)
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._completions and self._completions[0] < now - RATE_WINDOW_SECONDS:
+            self._completions.popleft()
+
+    def devices_per_second(self) -> float:
+        """Completion rate over the last RATE_WINDOW_SECONDS, or since start if shorter"""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            window = min(RATE_WINDOW_SECONDS, max(time.time() - self.started, 1e-9))
+            return len(self._completions) / window
+
+    def render(self, queue_status: Dict, frontier_depth: int) -> str:
+        """Render every metric, queue_status is DeviceDatabase.get_queue_status()"""
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        with self._lock:
+            active_sessions = self.active_sessions
+            devices_processed = self.devices_processed
+            connect_failures = dict(self.connect_failures)
+            skipped = dict(self.skipped)
+            session_fallbacks = self.session_fallbacks
+            unreachable = dict(self.unreachable)
+            started = self.started
+
+        # get_queue_status counts claimed rows as pending too, the gauge keeps the states disjoint
+        states = {
+            'pending': queue_status['pending'] - queue_status['processing'],
+            'processing': queue_status['processing'],
+            'processed': queue_status['processed']
+        }
+        metric('crawler_queue_devices', 'gauge', 'Devices in the crawl queue by state',
+               [({'state': state}, count) for state, count in states.items()])
+        metric('crawler_frontier_depth', 'gauge', 'Entries waiting in the in-memory frontier',
+               [({}, frontier_depth)])
+        metric('crawler_active_sessions', 'gauge', 'Open SSH sessions', [({}, active_sessions)])
+        metric('crawler_devices_processed_total', 'counter', 'Devices visited since the crawl started',
+               [({}, devices_processed)])
+        metric('crawler_devices_per_second', 'gauge', f'Devices visited per second over the last {RATE_WINDOW_SECONDS}s',
+               [({}, round(self.devices_per_second(), 3))])
+        metric('crawler_connect_failures_total', 'counter', 'Failed SSH logins by reason',
+               [({'reason': reason}, count) for reason, count in sorted(connect_failures.items())])
+        metric('crawler_unreachable_devices_total', 'counter', 'Devices failing the TCP/22 pre-scan by reason',
+               [({'reason': reason}, count) for reason, count in sorted(unreachable.items())])
+        metric('crawler_session_fallbacks_total', 'counter', 'Hosts retried with the conservative SSH session profile',
+               [({}, session_fallbacks)])
+        metric('crawler_devices_skipped_total', 'counter', 'Neighbours not queued because of a crawl limit',
+               [({'limit': reason}, count) for reason, count in sorted(skipped.items())])
+        metric('crawler_start_time_seconds', 'gauge', 'Unix time the crawl started', [({}, started)])
+
+        self._render_histograms(lines)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines: list):
+        """Render the timing registry's spans as Prometheus histograms"""
+        families = {}
+        for (name, label), histogram in timings.histograms().items():
+            metric_name, label_name = SPAN_METRICS.get(name, ('crawler_phase_duration_seconds', None))
+            if metric_name == 'crawler_phase_duration_seconds':
+                labels = {'phase': name}
+                if label:
+                    labels['label'] = label
+            else:
+                labels = {label_name: label} if label_name and label else {}
+            families.setdefault(metric_name, []).append((labels, histogram))
+
+        for metric_name, series in sorted(families.items()):
+            lines.append(f"# TYPE {metric_name} histogram")
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{metric_name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+                lines.append(f"{metric_name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric_name}_count{_format_labels(labels)} {histogram.count}")
+
+
+class MetricsServer:
+    """Serves /metrics over HTTP from a background thread"""
+
+    def __init__(self, render: Callable[[], str], port: int = 9108, host: str = '127.0.0.1'):
+        self.render = render
+        self.port = port
+        self.host = host
+        self._server = None
+        self._thread = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        render = self.render
+        logger = self.logger
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                try:
+                    body = render().encode()
+                except Exception as e:
+                    logger.error(f"Error rendering metrics: {str(e)}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics request: {format % args}")
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="Metrics", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Serving metrics on http://{self.host}:{self._server.server_port}/metrics")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Process-wide metrics shared by the crawler, connections and the async engine
+metrics = CrawlMetrics()
@@ -1,18 +1,91 @@
 import os
+from contextlib import contextmanager
 from typing import Dict, List
 from textfsm import TextFSM
 import re
+import threading
 import traceback
 import logging
+from timing import timings
+
+class TemplateCache:
+    """Process-wide cache of compiled TextFSM templates.
+
+    TextFSM objects carry parse state, so each template keeps a small pool
+    of compiled instances; a caller checks one out, resets it and hands it
+    back, and only concurrent parses of the same template ever compile a
+    second copy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._paths = {}
+        self._entries = {}
+
+    def resolve(self, key: tuple, resolver) -> str:
+        """Return the cached template path for key, resolving it on first use"""
+        path = self._paths.get(key)
+        if path is None:
+            path = resolver()
+            with self._lock:
+                self._paths[key] = path
+        return path
+
+    @contextmanager
+    def checkout(self, template_path: str, auto_reload: bool = False):
+        """Yield a reset TextFSM instance for template_path"""
+        mtime = os.path.getmtime(template_path) if auto_reload else None
+        with self._lock:
+            entry = self._entries.get(template_path)
+            if entry is None or (auto_reload and entry['mtime'] != mtime):
+                # First use, or the template changed on disk since it was compiled
+                entry = {'mtime': mtime, 'pool': []}
+                self._entries[template_path] = entry
+            template = entry['pool'].pop() if entry['pool'] else None
+
+        if template is None:
+            with open(template_path) as template_file:
+                template = TextFSM(template_file)
+        else:
+            template.Reset()
+
+        try:
+            yield template
+        finally:
+            with self._lock:
+                # Drop instances compiled from a template that has since been reloaded
+                if self._entries.get(template_path) is entry:
+                    entry['pool'].append(template)
+
+    def clear(self):
+        with self._lock:
+            self._paths.clear()
+            self._entries.clear()
+
+
+_template_cache = TemplateCache()
+
+
+# Templates ship next to this module, so parsing does not depend on the working directory
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
 
 class CommandParser:
-    def __init__(self, template_dir: str = 'templates'):
+    def __init__(self, template_dir: str = DEFAULT_TEMPLATE_DIR, auto_reload: bool = False):
         self.template_dir = template_dir
+        self.auto_reload = auto_reload  # Re-read templates edited on disk, for template development
         self.logger = logging.getLogger(__name__)
         self.logger.debug(f"Initialized CommandParser with template directory: {template_dir}")
 
     def _get_template_path(self, command: str, device_type: str = 'cisco_ios') -> str:
         """Get the appropriate template path based on command and device type"""
+        return _template_cache.resolve(
+            (self.template_dir, command, device_type),
+            lambda: self._find_template_path(command, device_type)
+        )
+
+    def _find_template_path(self, command: str, device_type: str) -> str:
+        """Locate the template file for a command, falling back to the IOS template"""
         # Map device types to their template suffixes
         template_suffixes = {
             'cisco_nxos': '_nxos',
@@ -37,12 +110,11 @@ class CommandParser:
             template_path = self._get_template_path(command, device_type)
             self.logger.debug(f"Using template: {template_path}")
             
-            with open(template_path) as template_file:
-                template = TextFSM(template_file)
+            with timings.span('parse', command), _template_cache.checkout(template_path, self.auto_reload) as template:
                 parsed = template.ParseText(output)
+                headers = template.header
                 
             # Convert to list of dictionaries
-            headers = template.header
             result = []
             for row in parsed:
                 result.append(dict(zip(headers, row)))
@@ -61,8 +133,7 @@ class CommandParser:
             template_path = self._get_template_path('show_version', device_type)
             
             # Parse the output
-            with open(template_path) as f:
-                template = TextFSM(f)
+            with timings.span('parse', 'show_version'), _template_cache.checkout(template_path, self.auto_reload) as template:
                 result = template.ParseText(output)
                 
             self.logger.info(f"Raw parsed output: {result}")
@@ -0,0 +1,273 @@
+import asyncio
+import errno
+import ipaddress
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+import logging
+
+from timing import timings
+
+# How long a TCP pre-check waits for the SYN/ACK before calling a host unreachable
+DEFAULT_PROBE_TIMEOUT = 1.0
+
+# errno values a non-blocking connect reports while the handshake is still in flight
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)
+
+
+def _reason(error: Exception) -> str:
+    """Name why a TCP connect failed: timeout, refused, unresolvable or unreachable"""
+    if isinstance(error, (socket.timeout, asyncio.TimeoutError)):
+        return 'timeout'
+    if isinstance(error, ConnectionRefusedError):
+        return 'refused'
+    if isinstance(error, socket.gaierror):
+        return 'unresolvable'
+    if isinstance(error, OSError) and error.errno in (errno.ETIMEDOUT,):
+        return 'timeout'
+    return 'unreachable'
+
+
+def _errno_reason(code: int) -> str:
+    if code == errno.ECONNREFUSED:
+        return 'refused'
+    if code == errno.ETIMEDOUT:
+        return 'timeout'
+    return 'unreachable'
+
+
+def tcp_probe(host: str, port: int = 22, timeout: float = DEFAULT_PROBE_TIMEOUT) -> str:
+    """Open and close a TCP connection, returns None if it succeeded or the reason it failed"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return None
+    except OSError as e:
+        return _reason(e)
+
+
+async def tcp_probe_async(host: str, port: int = 22, timeout: float = DEFAULT_PROBE_TIMEOUT) -> str:
+    """tcp_probe for the asyncio engine"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        return _reason(e)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return None
+
+
+class ReachabilityScanner:
+    """Probes TCP/22 of queued devices in parallel before a worker spends an SSH session on them.
+
+    A single background thread keeps up to max_in_flight non-blocking
+    connects open on a selector. Each submitted entry's management IP, then
+    its hostname if that is an address, is tried in turn. A hostname that
+    is a DNS name is only resolved, on a small resolver pool, once those
+    have failed, and its addresses are probed the same way, so the scan
+    falls back to the name just as NetworkDevice.connect does. on_result(entry,
+    reason) is called from the scanner or a resolver thread with reason None
+    once a target accepts, or with timeout, refused, unresolvable or
+    unreachable once all have failed.
+    """
+
+    def __init__(self, on_result: Callable[[Dict, str], None], port: int = 22,
+                 timeout: float = DEFAULT_PROBE_TIMEOUT, max_in_flight: int = 256,
+                 resolver_threads: int = 16):
+        self.on_result = on_result
+        self.port = port
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.resolver_threads = resolver_threads
+        self._waiting = deque()  # (entry, addresses to probe, DNS name still to resolve or None)
+        self._lock = threading.Lock()
+        self._selector = None
+        self._wakeup = None
+        self._thread = None
+        self._resolver = None
+        self._running = False
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _targets(entry: Dict) -> list:
+        """Addresses worth probing for an entry, in the order the crawler connects"""
+        targets = []
+        for candidate in (entry.get('mgmt_ip'), entry.get('hostname')):
+            try:
+                address = ipaddress.ip_address(candidate or '')
+            except ValueError:
+                continue
+            if address not in targets:
+                targets.append(address)
+        return targets
+
+    @staticmethod
+    def _name(entry: Dict) -> str:
+        """The entry's hostname if it has to be resolved before it can be probed"""
+        hostname = entry.get('hostname')
+        if not hostname:
+            return None
+        try:
+            ipaddress.ip_address(hostname)
+        except ValueError:
+            return hostname
+        return None
+
+    def start(self):
+        self._selector = selectors.DefaultSelector()
+        # Writing to the socketpair wakes select() when an entry is submitted
+        self._wakeup = socket.socketpair()
+        for sock in self._wakeup:
+            sock.setblocking(False)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ, None)
+        self._resolver = ThreadPoolExecutor(max_workers=self.resolver_threads, thread_name_prefix="ProbeResolver")
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ReachabilityScanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            try:
+                self._wakeup[1].send(b'x')
+            except BlockingIOError:
+                pass
+            self._thread.join()
+            self._thread = None
+        if self._resolver:
+            self._resolver.shutdown(wait=False, cancel_futures=True)
+            self._resolver = None
+        with self._lock:
+            self._waiting.clear()
+
+    def submit(self, entry: Dict):
+        """Queue an entry for probing, its result arrives through on_result"""
+        targets, name = self._targets(entry), self._name(entry)
+        if not targets and not name:
+            self.on_result(entry, None)
+            return
+        self._queue(entry, targets, name)
+
+    def _queue(self, entry: Dict, targets: list, name: str):
+        with self._lock:
+            self._waiting.append((entry, targets, name))
+        try:
+            self._wakeup[1].send(b'x')
+        except BlockingIOError:
+            pass  # A wakeup is already pending
+
+    def pending(self) -> int:
+        """Entries waiting for a probe slot, not counting those in flight"""
+        with self._lock:
+            return len(self._waiting)
+
+    def _open(self, entry: Dict, targets: list, name: str, in_flight: Dict, reason: str = None):
+        """Start a connect to the entry's next target, resolve its name once none are left, or report it"""
+        while targets:
+            address = targets.pop(0)
+            family = socket.AF_INET6 if address.version == 6 else socket.AF_INET
+            sock = None
+            try:
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                code = sock.connect_ex((str(address), self.port))
+                if code in _IN_PROGRESS:
+                    self._selector.register(sock, selectors.EVENT_WRITE, None)
+                    in_flight[sock] = (entry, targets, name, time.monotonic())
+                    return
+            except OSError as e:
+                # Out of descriptors or an unsupported address family fails this target, not the scanner thread
+                self.logger.warning(f"Could not probe {address} for {entry.get('hostname')}: {str(e)}")
+                if sock is not None:
+                    sock.close()
+                reason = 'unreachable'
+                continue
+            sock.close()
+            if code == 0:
+                self._finish(entry, None)
+                return
+            reason = _errno_reason(code)
+        if name:
+            tried = self._targets(entry)
+            future = self._resolver.submit(socket.getaddrinfo, name, self.port, 0, socket.SOCK_STREAM)
+            future.add_done_callback(lambda done: self._resolved(entry, tried, done, reason))
+            return
+        self._finish(entry, reason or 'unreachable')
+
+    def _resolved(self, entry: Dict, tried: list, future, reason: str):
+        """Queue the addresses a hostname resolved to that were not already probed"""
+        if not self._running or future.cancelled():
+            return
+        try:
+            infos = future.result()
+        except OSError as e:
+            # The management IP's failure says more than a short name missing from DNS
+            self._finish(entry, reason or _reason(e))
+            return
+        addresses = []
+        for info in infos:
+            address = ipaddress.ip_address(info[4][0].split('%')[0])
+            if address not in tried and address not in addresses:
+                addresses.append(address)
+        if not addresses:
+            self._finish(entry, reason or 'unreachable')
+            return
+        self._queue(entry, addresses, None)
+
+    def _finish(self, entry: Dict, reason: str):
+        try:
+            self.on_result(entry, reason)
+        except Exception as e:
+            self.logger.error(f"Error handling probe result for {entry.get('hostname')}: {str(e)}")
+
+    def _close(self, sock: socket.socket, in_flight: Dict):
+        self._selector.unregister(sock)
+        sock.close()
+        return in_flight.pop(sock)
+
+    def _run(self):
+        in_flight = {}  # socket -> (entry, remaining targets, name to resolve, started)
+        while self._running:
+            with self._lock:
+                count = min(len(self._waiting), max(self.max_in_flight - len(in_flight), 0))
+                batch = [self._waiting.popleft() for _ in range(count)]
+            for entry, targets, name in batch:
+                self._open(entry, targets, name, in_flight)
+
+            wait = self.timeout
+            if in_flight:
+                oldest = min(started for _, _, _, started in in_flight.values())
+                wait = max(oldest + self.timeout - time.monotonic(), 0)
+            for key, _ in self._selector.select(wait):
+                if key.fileobj is self._wakeup[0]:
+                    try:
+                        while self._wakeup[0].recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                sock = key.fileobj
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                entry, targets, name, started = self._close(sock, in_flight)
+                timings.observe('tcp.prescan', time.monotonic() - started)
+                if code == 0:
+                    self._finish(entry, None)
+                else:
+                    self._open(entry, targets, name, in_flight, _errno_reason(code))
+
+            now = time.monotonic()
+            for sock in [sock for sock, (_, _, _, started) in in_flight.items() if now - started >= self.timeout]:
+                entry, targets, name, started = self._close(sock, in_flight)
+                self._open(entry, targets, name, in_flight, 'timeout')
+
+        for sock in list(in_flight):
+            self._close(sock, in_flight)
+        self._selector.close()
+        for sock in self._wakeup:
+            sock.close()
@@ -0,0 +1,509 @@
+"""Fake Cisco devices served over real SSH on localhost.
+
+Every device gets its own loopback address (127.x.y.z) and the server
+listens once on a shared port, picking the device from the address the
+client dialled, so CDP management IPs can point straight at other fake
+devices. Loopback aliases beyond 127.0.0.1 work out of the box on Linux.
+
+    python simulator.py --devices 10000 --port 2222 --latency 0.05
+    python simulator.py --topology lab.json --port 2222
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import random
+import threading
+import zlib
+from typing import Dict, List
+
+try:
+    import resource
+except ImportError:  # Windows has no file descriptor limits to raise
+    resource = None
+
+import asyncssh
+
+INVALID_INPUT = "% Invalid input detected at '^' marker.\n"
+
+# Platform strings and software versions per flavour, shaped to match templates/
+FLAVOURS = {
+    'ios': {
+        'platform': 'WS-C2960X-48FPD-L',
+        'version': 'Cisco IOS Software, C2960X Software (C2960X-UNIVERSALK9-M), Version 15.2(7)E4, RELEASE SOFTWARE (fc2)',
+    },
+    'xe': {
+        'platform': 'C9500-24Y4C',
+        'version': 'Cisco IOS Software [Amsterdam], Catalyst L3 Switch Software (CAT9K_IOSXE), Version 17.3.4, RELEASE SOFTWARE (fc3)',
+    },
+    'nxos': {
+        'platform': 'N9K-C93180YC-EX',
+        'version': 'Cisco Nexus Operating System (NX-OS) Software, Version 9.3(8)',
+    },
+}
+
+SHOW_VERSION = {
+    'ios': """{version}
+Technical Support: http://www.cisco.com/techsupport
+ROM: Bootstrap program is C2960X boot loader
+
+{hostname} uptime is 12 weeks, 3 days, 4 hours, 2 minutes
+System image file is "flash:c2960x-universalk9-mz.152-7.E4.bin"
+
+cisco {platform} (APM86XXX) processor (revision D0) with 524288K bytes of memory.
+Processor board ID {serial}
+Last reset from power-on
+
+Configuration register is 0xF
+""",
+    'xe': """Cisco IOS XE Software, Version 17.03.04
+{version}
+Technical Support: http://www.cisco.com/techsupport
+
+{hostname} uptime is 30 weeks, 1 day, 7 hours, 12 minutes
+System image file is "bootflash:packages.conf"
+
+cisco {platform} (X86) processor with 1392780K/6147K bytes of memory.
+Processor board ID {serial}
+32 Ten Gigabit Ethernet interfaces
+
+Configuration register is 0x102
+""",
+    'nxos': """Cisco Nexus Operating System (NX-OS) Software
+TAC support: http://www.cisco.com/tac
+
+Software
+  NXOS: version 9.3(8)
+
+Hardware
+  cisco Nexus9000 {platform} chassis
+  Intel(R) Xeon(R) CPU  @ 1.80GHz with 24632252 kB of memory.
+  Processor board ID {serial}
+
+  Device name: {hostname}
+""",
+}
+
+CDP_ENTRY = {
+    'ios': """-------------------------
+Device ID: {hostname}.lab.example.com({serial})
+Entry address(es):
+  IP address: {address}
+Platform: cisco {platform},  Capabilities: {capabilities}
+Interface: {local_port},  Port ID (outgoing port): {remote_port}
+Holdtime : 150 sec
+
+Version :
+{version}
+
+advertisement version: 2
+""",
+    'nxos': """----------------------------------------
+Device ID: {hostname}({serial})
+IP address: {address}
+Platform: {platform},  Capabilities: {capabilities}
+Interface: {local_port},  Port ID (outgoing port): {remote_port}
+Holdtime: 148 sec
+
+Version :
+{version}
+
+Advertisement Version: 2
+""",
+}
+CDP_ENTRY['xe'] = CDP_ENTRY['ios']
+
+# CDP-only endpoints that hang off access switches but never answer SSH
+ENDPOINTS = {
+    'phone': ('IP Phone 8845', 'Host Phone Two-port Mac Relay', 'SIP 14.1(1)'),
+    'ap': ('AIR-AP2802I-B-K9', 'Trans-Bridge Source-Route-Bridge IGMP', 'Cisco AP Software, ap3g3-k9w8 Version: 17.3.4'),
+}
+
+CAPABILITIES = {'ios': 'Switch IGMP', 'xe': 'Router Switch IGMP', 'nxos': 'Router Switch IGMP Filtering Supports-STP-Dispute'}
+
+
+class FakeDevice:
+    """One simulated device and the canned output it returns per command
+
+    fail_mode makes the device misbehave: 'auth' rejects every login,
+    'local' only accepts the network's local account,
+    'hang' accepts the session but never shows a prompt, and 'unreachable'
+    has no listener, so its TCP connect is refused like a host with SSH down.
+    """
+
+    def __init__(self, hostname: str, address: str, flavour: str = 'ios', platform: str = None,
+                 serial: str = None, fail_mode: str = None, endpoints: List[Dict] = None):
+        self.hostname = hostname
+        self.address = address
+        self.flavour = flavour
+        self.platform = platform or FLAVOURS[flavour]['platform']
+        self.serial = serial or f"FOC{zlib.crc32(hostname.encode()) % 10 ** 8:08d}"
+        self.fail_mode = fail_mode
+        self.endpoints = endpoints or []
+        self.neighbors: List['FakeDevice'] = []
+
+    @property
+    def prompt(self) -> str:
+        return f"{self.hostname}#"
+
+    def _port_name(self, index: int) -> str:
+        if self.flavour == 'nxos':
+            return f"Ethernet1/{index + 1}"
+        return f"GigabitEthernet1/0/{index + 1}"
+
+    def _cdp_entry(self, index: int, hostname: str, serial: str, address: str, platform: str,
+                   capabilities: str, version: str, remote_port: str) -> str:
+        return CDP_ENTRY[self.flavour].format(
+            hostname=hostname, serial=serial, address=address, platform=platform,
+            capabilities=capabilities, version=version,
+            local_port=self._port_name(index), remote_port=remote_port
+        )
+
+    def show_cdp_neighbors_detail(self) -> str:
+        entries = []
+        for i, neighbor in enumerate(self.neighbors):
+            remote_index = neighbor.neighbors.index(self) if self in neighbor.neighbors else 0
+            entries.append(self._cdp_entry(
+                i, neighbor.hostname, neighbor.serial, neighbor.address, neighbor.platform,
+                CAPABILITIES[neighbor.flavour], FLAVOURS[neighbor.flavour]['version'],
+                neighbor._port_name(remote_index)
+            ))
+        for i, endpoint in enumerate(self.endpoints, start=len(self.neighbors)):
+            platform, capabilities, version = ENDPOINTS[endpoint['kind']]
+            entries.append(self._cdp_entry(
+                i, endpoint['hostname'], endpoint['hostname'][-8:].upper(), endpoint['address'],
+                platform, capabilities, version, 'Port 1'
+            ))
+        return ''.join(entries)
+
+    def run(self, command: str) -> str:
+        """Return the output for a command, with Cisco style errors for unknown ones"""
+        command = ' '.join(command.split())
+        if command.startswith('terminal '):
+            return ''
+        if command == 'show version':
+            return SHOW_VERSION[self.flavour].format(
+                hostname=self.hostname, platform=self.platform, serial=self.serial,
+                version=FLAVOURS[self.flavour]['version']
+            )
+        if command == 'show cdp neighbors detail':
+            return self.show_cdp_neighbors_detail()
+        return INVALID_INPUT
+
+    def to_dict(self) -> Dict:
+        return {
+            'hostname': self.hostname,
+            'address': self.address,
+            'flavour': self.flavour,
+            'platform': self.platform,
+            'serial': self.serial,
+            'fail_mode': self.fail_mode,
+            'endpoints': self.endpoints,
+            'neighbors': [neighbor.address for neighbor in self.neighbors],
+        }
+
+
+def _link(a: FakeDevice, b: FakeDevice):
+    if b not in a.neighbors:
+        a.neighbors.append(b)
+        b.neighbors.append(a)
+
+
+def build_tree_topology(count: int, fanout: int = 3, base_address: str = '127.1.0.1') -> Dict[str, FakeDevice]:
+    """Build count IOS devices wired as a tree, keyed by management address"""
+    base = ipaddress.IPv4Address(base_address)
+    devices = []
+    for i in range(count):
+        device = FakeDevice(f"site-{i // 100:02d}-{i % 100:02d}", str(base + i))
+        if i:
+            _link(devices[(i - 1) // fanout], device)
+        devices.append(device)
+    return {device.address: device for device in devices}
+
+
+def generate_topology(count: int, seed: int = 1, cores: int = 2, access_per_distribution: int = 20,
+                      endpoints_per_access: int = 4, auth_failure_rate: float = 0.0,
+                      hang_rate: float = 0.0, unreachable_rate: float = 0.0,
+                      local_account_rate: float = 0.0, base_address: str = '127.1.0.1') -> Dict[str, FakeDevice]:
+    """Build a campus-style topology of count SSH devices, keyed by management address
+
+    NX-OS cores are fully meshed, each IOS-XE distribution pair uplinks to
+    every core, and IOS access switches dual-home to their distribution pair
+    with a few phones and APs hanging off each. Failure rates are fractions
+    of non-core devices given the matching fail_mode.
+    """
+    rng = random.Random(seed)
+    base = ipaddress.IPv4Address(base_address)
+    devices: List[FakeDevice] = []
+    # Endpoints get addresses above the SSH devices so they never collide
+    endpoint_address = [int(base) + count]
+
+    def add(flavour: str) -> FakeDevice:
+        i = len(devices)
+        device = FakeDevice(f"site-{i // 100:02d}-{i % 100:02d}", str(base + i), flavour)
+        roll = rng.random()
+        if devices and flavour != 'nxos':
+            if roll < auth_failure_rate:
+                device.fail_mode = 'auth'
+            elif roll < auth_failure_rate + hang_rate:
+                device.fail_mode = 'hang'
+            elif roll < auth_failure_rate + hang_rate + unreachable_rate:
+                device.fail_mode = 'unreachable'
+            elif roll < auth_failure_rate + hang_rate + unreachable_rate + local_account_rate:
+                device.fail_mode = 'local'
+        devices.append(device)
+        return device
+
+    core_devices = [add('nxos') for _ in range(min(cores, count))]
+    for i, core in enumerate(core_devices):
+        for other in core_devices[i + 1:]:
+            _link(core, other)
+
+    while len(devices) < count:
+        pair = [add('xe') for _ in range(min(2, count - len(devices)))]
+        for distribution in pair:
+            for core in core_devices:
+                _link(distribution, core)
+        if len(pair) == 2:
+            _link(pair[0], pair[1])
+        for _ in range(access_per_distribution):
+            if len(devices) >= count:
+                break
+            access = add('ios')
+            for distribution in pair:
+                _link(access, distribution)
+            for n in range(rng.randint(0, endpoints_per_access)):
+                kind = 'phone' if rng.random() < 0.7 else 'ap'
+                access.endpoints.append({
+                    'kind': kind,
+                    'hostname': f"SEP{endpoint_address[0]:012X}" if kind == 'phone' else f"ap-{endpoint_address[0]:x}",
+                    'address': str(ipaddress.IPv4Address(endpoint_address[0])),
+                })
+                endpoint_address[0] += 1
+
+    return {device.address: device for device in devices}
+
+
+def save_topology(devices: Dict[str, FakeDevice], path: str):
+    with open(path, 'w') as f:
+        json.dump([device.to_dict() for device in devices.values()], f)
+
+
+def load_topology(path: str) -> Dict[str, FakeDevice]:
+    with open(path) as f:
+        nodes = json.load(f)
+    devices = {
+        node['address']: FakeDevice(node['hostname'], node['address'], node.get('flavour', 'ios'),
+                                    node.get('platform'), node.get('serial'), node.get('fail_mode'),
+                                    node.get('endpoints'))
+        for node in nodes
+    }
+    for node in nodes:
+        device = devices[node['address']]
+        device.neighbors = [devices[address] for address in node.get('neighbors', [])]
+    return devices
+
+
+class _FakeSSHServer(asyncssh.SSHServer):
+    def __init__(self, network: 'FakeNetwork'):
+        self.network = network
+        self.device = None
+
+    def connection_made(self, conn):
+        # Only accept clients on this host
+        peer = conn.get_extra_info('peername')[0]
+        self.device = self.network.devices.get(conn.get_extra_info('sockname')[0])
+        if not ipaddress.ip_address(peer).is_loopback or self.device is None:
+            conn.close()
+
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def password_auth_supported(self) -> bool:
+        return True
+
+    async def validate_password(self, username: str, password: str) -> bool:
+        if self.network.connect_latency:
+            await asyncio.sleep(self.network.connect_latency)
+        if self.device is not None and self.device.fail_mode == 'auth':
+            return False
+        if self.device is not None and self.device.fail_mode == 'local':
+            return (username, password) == (self.network.local_username, self.network.local_password)
+        return (username, password) == (self.network.username, self.network.password)
+
+
+class FakeNetwork:
+    """SSH server answering for every device in a topology
+
+    latency and jitter (seconds) delay every command reply, and busy
+    devices pay cdp_latency_per_neighbor on top for each CDP entry.
+    """
+
+    def __init__(self, devices: Dict[str, FakeDevice], port: int = 2222,
+                 username: str = 'admin', password: str = 'admin', latency: float = 0.0,
+                 jitter: float = 0.0, cdp_latency_per_neighbor: float = 0.0,
+                 connect_latency: float = 0.0, seed: int = 1, local_username: str = 'local',
+                 local_password: str = 'local'):
+        self.devices = devices
+        self.port = port
+        self.username = username
+        self.password = password
+        self.local_username = local_username  # The only login devices with fail_mode 'local' accept
+        self.local_password = local_password
+        self.latency = latency
+        self.jitter = jitter
+        self.cdp_latency_per_neighbor = cdp_latency_per_neighbor
+        self.connect_latency = connect_latency
+        self.commands_served = 0
+        self.sessions = 0
+        self.logger = logging.getLogger(__name__)
+        self._rng = random.Random(seed)
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    def _listen_addresses(self) -> List[str]:
+        """Addresses that get a listener, so unreachable devices and CDP-only endpoints refuse TCP"""
+        addresses = [address for address, device in self.devices.items() if device.fail_mode != 'unreachable']
+        if resource is not None:
+            # One listening socket per device, plus headroom for the sessions themselves
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            wanted = len(addresses) + 4096
+            if soft != resource.RLIM_INFINITY and soft < wanted:
+                limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+                resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        return addresses
+
+    async def start(self):
+        """Start listening, returns once the port is bound"""
+        host_key = asyncssh.generate_private_key('ssh-ed25519')
+        self._server = await asyncssh.create_server(
+            lambda: _FakeSSHServer(self), self._listen_addresses(), self.port,
+            server_host_keys=[host_key],
+            process_factory=self._handle_process,
+            # Echo is done by _handle_process as each line is read, like a Cisco CLI, so
+            # typeahead is only echoed once the replies to earlier commands are out
+            line_editor=False,
+            reuse_address=True,
+            backlog=4096
+        )
+        self.logger.info(f"Serving {len(self.devices)} fake devices on port {self.port}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_in_thread(self):
+        """Run the server on its own event loop thread, for use from synchronous code"""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="FakeNetwork", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop_thread(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def _command_delay(self, device: FakeDevice, command: str) -> float:
+        delay = self.latency + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if command.startswith('show cdp'):
+            delay += self.cdp_latency_per_neighbor * (len(device.neighbors) + len(device.endpoints))
+        return max(delay, 0)
+
+    async def _handle_process(self, process: asyncssh.SSHServerProcess):
+        device = self.devices.get(process.get_extra_info('sockname')[0])
+        if device is None:
+            process.exit(1)
+            return
+        self.sessions += 1
+
+        if device.fail_mode == 'hang':
+            # Say nothing until the client gives up
+            await process.stdin.read()
+            process.exit(0)
+            return
+
+        process.stdout.write(f"\n{device.prompt}")
+        while not process.stdin.at_eof():
+            try:
+                line = await process.stdin.readline()
+            except (asyncssh.BreakReceived, asyncssh.TerminalSizeChanged):
+                continue
+            except asyncssh.ConnectionLost:
+                break
+            command = line.strip()
+            process.stdout.write(f"{command}\n")
+            if command in ('exit', 'logout', 'quit'):
+                break
+            if command:
+                delay = self._command_delay(device, command)
+                if delay:
+                    await asyncio.sleep(delay)
+                self.commands_served += 1
+                process.stdout.write(device.run(command))
+            process.stdout.write(device.prompt)
+        process.exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake CDP network over SSH")
+    parser.add_argument("--devices", type=int, default=50, help="Number of SSH devices to generate")
+    parser.add_argument("--topology", help="Load a topology JSON file instead of generating one")
+    parser.add_argument("--save-topology", help="Write the generated topology to this JSON file")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=2222)
+    parser.add_argument("--username", default='admin')
+    parser.add_argument("--password", default='admin')
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every command")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds on top of --latency")
+    parser.add_argument("--cdp-latency", type=float, default=0.0, help="Extra seconds per CDP neighbour")
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="Seconds added to each login")
+    parser.add_argument("--auth-failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--unreachable-rate", type=float, default=0.0)
+    parser.add_argument("--local-account-rate", type=float, default=0.0,
+                        help="Fraction of devices that only accept the local account")
+    parser.add_argument("--local-username", default='local')
+    parser.add_argument("--local-password", default='local')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.topology:
+        devices = load_topology(args.topology)
+    else:
+        devices = generate_topology(args.devices, seed=args.seed, auth_failure_rate=args.auth_failure_rate,
+                                    hang_rate=args.hang_rate, unreachable_rate=args.unreachable_rate,
+                                    local_account_rate=args.local_account_rate)
+    if args.save_topology:
+        save_topology(devices, args.save_topology)
+
+    network = FakeNetwork(devices, args.port, args.username, args.password, latency=args.latency,
+                          jitter=args.jitter, cdp_latency_per_neighbor=args.cdp_latency,
+                          connect_latency=args.connect_latency, seed=args.seed,
+                          local_username=args.local_username, local_password=args.local_password)
+    seed = next(iter(devices.values()))
+    print(f"Seed device: {seed.address} ({seed.hostname}), port {args.port}")
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(network.start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(network.stop())
+
+
+if __name__ == "__main__":
+    main()
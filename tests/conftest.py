@@ -0,0 +1,56 @@
+import os
+import socket
+import sys
+
+import pytest
+
+# The crawler's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import connect
+from simulator import FakeDevice, FakeNetwork
+
+# netmiko device_type for each simulated flavour
+DEVICE_TYPES = {'ios': 'cisco_ios', 'xe': 'cisco_xe', 'nxos': 'cisco_nxos'}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(autouse=True)
+def fresh_session_profiles():
+    """Forget hosts an earlier test moved to the conservative profile"""
+    connect._conservative_hosts.clear()
+    yield
+    connect._conservative_hosts.clear()
+
+
+@pytest.fixture
+def simulated_network():
+    """Start a FakeNetwork for a list of devices, stopped when the test ends"""
+    networks = []
+
+    def start(devices, **options) -> FakeNetwork:
+        network = FakeNetwork({device.address: device for device in devices}, port=_free_port(), **options)
+        network.start_in_thread()
+        networks.append(network)
+        return network
+
+    yield start
+    for network in networks:
+        network.stop_thread()
+
+
+@pytest.fixture
+def linked_devices():
+    """Three linked devices, one of each flavour, so every CDP table has entries"""
+    core = FakeDevice('site-00-00', '127.1.0.1', 'nxos')
+    distribution = FakeDevice('site-00-01', '127.1.0.2', 'xe')
+    access = FakeDevice('site-00-02', '127.1.0.3', 'ios')
+    for device, neighbor in ((core, distribution), (distribution, access)):
+        device.neighbors.append(neighbor)
+        neighbor.neighbors.append(device)
+    return [core, distribution, access]
@@ -0,0 +1,33 @@
+import asyncio
+
+from async_engine import AsyncDeviceSession
+from devices import NetworkDevice
+
+
+def test_async_batch_matches_single_commands_and_times_each_reply(simulated_network, linked_devices):
+    latency = 0.2
+    network = simulated_network(linked_devices, latency=latency)
+    device = linked_devices[2]
+    commands = list(NetworkDevice.VISIT_COMMANDS)
+
+    async def visit():
+        session = AsyncDeviceSession(device.address, network.username, network.password,
+                                     port=network.port, timeout=10)
+        await session.connect()
+        try:
+            del session.latencies[:]
+            batched = await session.send_commands(commands)
+            samples = [seconds for phase, seconds in session.latencies if phase == 'command']
+            single = {command: await session.send_command(command) for command in commands}
+        finally:
+            await session.close()
+        return batched, samples, single
+
+    batched, samples, single = asyncio.run(visit())
+    # A single read keeps the newline before the prompt, splitting a batch drops it
+    assert {command: output.rstrip() for command, output in batched.items()} == \
+        {command: output.rstrip() for command, output in single.items()}
+    assert device.serial in batched['show version']
+    # One sample per command, each covering its own reply rather than the whole batch
+    assert len(samples) == len(commands)
+    assert all(latency * 0.75 <= seconds < latency * 1.75 for seconds in samples), samples
@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+from conftest import DEVICE_TYPES
+from connect import DeviceConnection, split_batch_output
+from devices import NetworkDevice
+
+PROMPT = re.escape('site-00-02#')
+
+
+def test_split_batch_output_pairs_each_reply_with_its_command():
+    output = ("show cdp neighbors detail\nDevice ID: site-00-01\n"
+              "site-00-02#show version\nCisco IOS Software\n"
+              "site-00-02#")
+    outputs = split_batch_output(output, ['show cdp neighbors detail', 'show version'], PROMPT)
+    assert outputs == {
+        'show cdp neighbors detail': 'Device ID: site-00-01',
+        'show version': 'Cisco IOS Software',
+    }
+
+
+def test_split_batch_output_ignores_the_prompt_inside_a_line():
+    output = "show version\nuptime of site-00-02# is 1 day\nsite-00-02#"
+    outputs = split_batch_output(output, ['show version'], PROMPT)
+    assert outputs == {'show version': 'uptime of site-00-02# is 1 day'}
+
+
+def test_split_batch_output_rejects_a_missing_prompt():
+    output = "show cdp neighbors detail\nDevice ID: site-00-01\nsite-00-02#show version\nCisco IOS"
+    with pytest.raises(ValueError, match='Expected 2 prompts'):
+        split_batch_output(output, ['show cdp neighbors detail', 'show version'], PROMPT)
+
+
+def test_split_batch_output_rejects_replies_out_of_step():
+    # The reply to an earlier command landed first, so every echo is one command late
+    output = "terminal length 0\nsite-00-02#show cdp neighbors detail\nDevice ID: site-00-01\nsite-00-02#"
+    with pytest.raises(ValueError, match='out of step'):
+        split_batch_output(output, ['show cdp neighbors detail', 'show version'], PROMPT)
+
+
+def _connect(device, network) -> DeviceConnection:
+    connection = DeviceConnection(device.address, network.username, network.password,
+                                  DEVICE_TYPES[device.flavour], port=network.port, connect_timeout=10)
+    assert connection.connect()
+    return connection
+
+
+@pytest.mark.parametrize('index', [0, 1, 2], ids=['nxos', 'xe', 'ios'])
+def test_batched_replies_match_sequential_replies(simulated_network, linked_devices, index):
+    network = simulated_network(linked_devices, latency=0.02)
+    device = linked_devices[index]
+    connection = _connect(device, network)
+    try:
+        batched = connection.send_commands(list(NetworkDevice.VISIT_COMMANDS), use_cache=False)
+        sequential = {command: connection.send_command(command, use_cache=False)
+                      for command in NetworkDevice.VISIT_COMMANDS}
+    finally:
+        connection.disconnect()
+    assert connection.session_profile == 'fast'
+    assert batched == sequential
+    assert device.neighbors[0].hostname in batched['show cdp neighbors detail']
+    assert device.serial in batched['show version']
+
+
+def test_batched_commands_record_one_latency_sample_per_reply(simulated_network, linked_devices):
+    latency = 0.2
+    network = simulated_network(linked_devices, latency=latency)
+    connection = _connect(linked_devices[2], network)
+    try:
+        del connection.latencies[:]
+        connection.send_commands(list(NetworkDevice.VISIT_COMMANDS), use_cache=False)
+    finally:
+        connection.disconnect()
+    samples = [seconds for phase, seconds in connection.latencies if phase == 'command']
+    # One sample per command, each covering its own reply rather than the whole batch
+    assert len(samples) == len(NetworkDevice.VISIT_COMMANDS)
+    assert all(latency * 0.75 <= seconds < latency * 1.75 for seconds in samples), samples
@@ -0,0 +1,100 @@
+import pytest
+
+from credentials import CredentialChain
+from data import DeviceDatabase
+from devices import NetworkDevice
+
+MAIN = {'username': 'admin', 'password': 'admin'}
+LOCAL = {'name': 'local', 'username': 'local', 'password': 'local'}
+BREAKGLASS = {'name': 'breakglass', 'username': 'breakglass', 'password': 'secret'}
+
+
+def _site(hostname: str) -> str:
+    return hostname[:7]
+
+
+def _names(credentials) -> list:
+    return [credential['name'] for credential in credentials]
+
+
+def test_candidates_follow_config_order_until_something_is_learned():
+    chain = CredentialChain([MAIN, LOCAL, BREAKGLASS], site_of=_site)
+    assert _names(chain.candidates('site-01-01')) == ['admin', 'local', 'breakglass']
+
+
+def test_host_then_site_preference_come_first():
+    chain = CredentialChain([MAIN, LOCAL, BREAKGLASS], site_of=_site)
+    local, breakglass = chain.credentials[1], chain.credentials[2]
+    chain.succeeded('site-01-01', local)
+    chain.succeeded('site-01-02', local)
+    chain.succeeded('site-01-03', breakglass)
+    assert _names(chain.candidates('site-01-03')) == ['breakglass', 'local', 'admin']
+    assert _names(chain.candidates('site-01-09')) == ['local', 'admin', 'breakglass']
+    assert _names(chain.candidates('site-02-01')) == ['admin', 'local', 'breakglass']
+
+
+def test_rejected_credentials_are_not_offered_again():
+    chain = CredentialChain([MAIN, LOCAL], site_of=_site)
+    main, local = chain.credentials
+    chain.succeeded('site-01-01', main)
+    chain.failed('site-01-01', main)
+    assert _names(chain.candidates('site-01-01')) == ['local']
+    # The site no longer prefers a credential its only host went on to reject
+    assert _names(chain.candidates('site-01-02')) == ['admin', 'local']
+    chain.failed('site-01-01', local)
+    assert chain.candidates('site-01-01') == []
+
+
+def test_duplicate_usernames_get_distinct_names():
+    chain = CredentialChain([MAIN, {'username': 'admin', 'password': 'other'}])
+    assert _names(chain.credentials) == ['admin', 'admin#2']
+
+
+def test_learned_credentials_and_rejections_survive_a_restart(tmp_path):
+    db = DeviceDatabase(str(tmp_path / 'crawl.db'))
+    try:
+        chain = CredentialChain([MAIN, LOCAL], db=db, site_of=_site)
+        chain.load('crawl-1')
+        main, local = chain.credentials
+        chain.failed('site-01-01', main)
+        chain.succeeded('site-01-01', local)
+
+        # A later crawl starts from the working credential, a resume of this one also skips the rejection
+        later = CredentialChain([MAIN, LOCAL], db=db, site_of=_site)
+        later.load('crawl-2')
+        assert _names(later.candidates('site-01-01')) == ['local', 'admin']
+        assert _names(later.candidates('site-01-02')) == ['local', 'admin']
+        resumed = CredentialChain([MAIN, LOCAL], db=db, site_of=_site)
+        resumed.load('crawl-1')
+        assert _names(resumed.candidates('site-01-01')) == ['local']
+    finally:
+        db.close()
+
+
+def _device(device, network, chain) -> NetworkDevice:
+    return NetworkDevice(device.address, MAIN['username'], MAIN['password'], port=network.port,
+                         connect_timeout=10, credentials=chain)
+
+
+def test_device_falls_back_to_a_credential_it_accepts(simulated_network, linked_devices):
+    access = linked_devices[2]
+    access.fail_mode = 'local'
+    network = simulated_network(linked_devices, local_username=LOCAL['username'], local_password=LOCAL['password'])
+    chain = CredentialChain([MAIN, LOCAL])
+
+    device = _device(access, network, chain)
+    device.connect()
+    device.disconnect()
+    assert device.credential['name'] == 'local'
+    assert _names(chain.candidates(access.address)) == ['local']
+
+
+def test_device_gives_up_once_every_credential_is_rejected(simulated_network, linked_devices):
+    access = linked_devices[2]
+    access.fail_mode = 'auth'
+    network = simulated_network(linked_devices)
+    chain = CredentialChain([MAIN, LOCAL])
+
+    with pytest.raises(ConnectionError):
+        _device(access, network, chain).connect()
+    assert chain.candidates(access.address) == []
@@ -0,0 +1,44 @@
+import re
+
+import pytest
+
+from filters import HostFilter
+
+
+def test_invalid_regex_names_the_rule():
+    with pytest.raises(ValueError, match=re.escape("'re:site-(0[1-5]'")):
+        HostFilter(['re:^core-', 're:site-(0[1-5]'])
+
+
+def test_empty_rules_are_skipped():
+    host_filter = HostFilter(['', None, '   ', 'site-01-01'])
+    assert len(host_filter) == 1
+    assert host_filter.matches('site-01-01')
+    assert not host_filter.matches('none')
+    assert not HostFilter([None, ''])
+
+
+def test_regex_rules_match_like_each_rule_on_its_own():
+    rules = [
+        're:^site-0[1-5]-',
+        're:dist$',
+        're:(ap|phone)\\d+',
+        're:(?i)CORE',  # Inline flag, only valid at the start of its own pattern
+        're:^(sw)-\\1',  # Numbered backreference, renumbered if joined
+        're:^(?P<pod>p\\d)-(?P=pod)$',  # Named group, clashes with itself if joined twice
+        're:^lab\\(?x',
+    ]
+    host_filter = HostFilter(rules)
+    names = ['site-03-10', 'site-09-10', 'SITE-01-02', 'bldg-dist', 'ap12', 'phone', 'my-core-1',
+             'sw-sw', 'sw-sx', 'p1-p1', 'p1-p2', 'lab(x', 'labx', 'lab', 'other']
+    for name in names:
+        expected = any(re.search(rule[3:], name, re.I) for rule in rules)
+        assert host_filter.matches(name) == expected, name
+
+
+def test_plain_regexes_share_one_pattern():
+    host_filter = HostFilter([f're:^site-{i:03d}-' for i in range(500)] + ['re:^(sw)-\\1'])
+    assert len(host_filter._regexes) == 2
+    assert host_filter.matches('site-499-01')
+    assert host_filter.matches('sw-sw')
+    assert not host_filter.matches('site-500-01')
@@ -0,0 +1,82 @@
+import threading
+from typing import Dict, List, Tuple
+import logging
+
+from timing import Histogram
+
+PHASES = ('connect', 'command')
+
+
+class AdaptiveTimeouts:
+    """Connect and command timeouts learned from the latencies each host has shown.
+
+    Every successful connect and command is recorded per host and per
+    platform. A visit then waits p99 x margin of the host's own history,
+    or of its platform's while the host has fewer than min_samples, clamped
+    to [floor, ceiling]. Hosts and platforms with no history get the default.
+    A batch of pipelined commands is recorded as one sample per reply, so
+    the command timeout stays a per-command one and a batch waits that
+    long for each of its commands.
+    Histograms are stored in the latency_stats table so later crawls start
+    from what earlier ones saw.
+    """
+
+    def __init__(self, db, margin: float = 3.0, min_samples: int = 5,
+                 floors: Dict[str, float] = None, ceiling: float = 120.0):
+        self.db = db
+        self.margin = margin
+        self.min_samples = min_samples
+        self.floors = floors or {'connect': 2.0, 'command': 5.0}
+        self.ceiling = ceiling
+        self._histograms = {}  # (scope, name, phase) -> Histogram, scope is 'host' or 'platform'
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def load(self):
+        """Read the histograms earlier crawls stored"""
+        histograms = {}
+        for row in self.db.get_latency_stats():
+            histogram = Histogram()
+            if len(row['buckets']) != len(histogram.counts):
+                continue  # Stored with different bucket bounds, start that one over
+            histogram.counts = row['buckets']
+            histogram.count, histogram.sum = row['count'], row['sum']
+            histogram.min, histogram.max = row['min'], row['max']
+            histograms[(row['scope'], row['name'], row['phase'])] = histogram
+        with self._lock:
+            self._histograms = histograms
+        self.logger.info(f"Loaded {len(histograms)} latency histograms")
+
+    def record(self, hostname: str, platform: str, samples: List[Tuple[str, float]]):
+        """Add a visit's (phase, seconds) samples to its host and platform, then persist them"""
+        if not samples:
+            return
+        keys = [('host', hostname, phase) for phase in PHASES]
+        if platform:
+            keys += [('platform', platform, phase) for phase in PHASES]
+        with self._lock:
+            for phase, seconds in samples:
+                for key in keys:
+                    if key[2] == phase:
+                        histogram = self._histograms.get(key)
+                        if histogram is None:
+                            histogram = self._histograms[key] = Histogram()
+                        histogram.observe(seconds)
+            rows = [
+                {'scope': scope, 'name': name, 'phase': phase, 'count': histogram.count,
+                 'sum': histogram.sum, 'min': histogram.min, 'max': histogram.max,
+                 'buckets': list(histogram.counts)}
+                for (scope, name, phase), histogram in
+                ((key, self._histograms.get(key)) for key in keys) if histogram is not None
+            ]
+        self.db.save_latency_stats(rows)
+
+    def timeout(self, hostname: str, platform: str, phase: str, default: float = None) -> float:
+        """Timeout for a phase of the next visit to a host, default if nothing is known yet"""
+        with self._lock:
+            for key in (('host', hostname, phase), ('platform', platform, phase)):
+                histogram = self._histograms.get(key)
+                if histogram is not None and histogram.count >= self.min_samples:
+                    learned = histogram.percentile(0.99) * self.margin
+                    return min(max(learned, self.floors.get(phase, 0)), self.ceiling)
+        return default
@@ -0,0 +1,140 @@
+import csv
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# Upper bounds in seconds, from sub-millisecond parses up to slow SSH logins
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+
+class Histogram:
+    """Latency histogram with fixed bucket bounds, cheap enough to update on every call"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """Estimate the q-th quantile by interpolating inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                upper = min(bound, self.max)
+                lower = max(lower, self.min)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+    def snapshot(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        }
+
+
+class TimingRegistry:
+    """Named latency histograms for the phases of a crawl.
+
+    Spans are keyed by a name such as 'ssh.command' plus an optional label
+    such as the command text, so one histogram exists per command rather
+    than one per call site.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, name: str, seconds: float, label: str = None):
+        key = (name, label)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name: str, label: str = None):
+        """Time the enclosed block, failures included"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, label)
+
+    def histograms(self) -> Dict[tuple, Histogram]:
+        """Copies of every histogram keyed by (name, label), safe to read while spans keep landing"""
+        with self._lock:
+            copies = {}
+            for key, histogram in self._histograms.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts = list(histogram.counts)
+                copy.count, copy.sum, copy.min, copy.max = histogram.count, histogram.sum, histogram.min, histogram.max
+                copies[key] = copy
+            return copies
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                f"{name} {label}" if label else name: histogram.snapshot()
+                for (name, label), histogram in sorted(self._histograms.items(), key=lambda item: (item[0][0], item[0][1] or ''))
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def format_table(self) -> str:
+        """Render the spans as a fixed-width table, slowest total first"""
+        rows = sorted(self.snapshot().items(), key=lambda item: item[1]['sum'], reverse=True)
+        width = max([len(name) for name, _ in rows] + [4])
+        lines = [f"{'span':<{width}}  {'count':>7}  {'total s':>9}  {'mean ms':>9}  "
+                 f"{'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'max ms':>9}"]
+        for name, stats in rows:
+            lines.append(
+                f"{name:<{width}}  {stats['count']:>7}  {stats['sum']:>9.2f}  "
+                f"{stats['sum'] / stats['count'] * 1000:>9.1f}  {stats['p50'] * 1000:>9.1f}  "
+                f"{stats['p95'] * 1000:>9.1f}  {stats['p99'] * 1000:>9.1f}  {stats['max'] * 1000:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def export(self, output_path: str):
+        """Write the spans to JSON, or to CSV when the path ends in .csv"""
+        snapshot = self.snapshot()
+        with open(output_path, 'w', newline='') as f:
+            if output_path.endswith('.csv'):
+                writer = csv.writer(f)
+                writer.writerow(['span', 'count', 'sum', 'min', 'max', 'p50', 'p95', 'p99'])
+                for name, stats in snapshot.items():
+                    writer.writerow([name] + [stats[key] for key in ('count', 'sum', 'min', 'max', 'p50', 'p95', 'p99')])
+            else:
+                json.dump(snapshot, f, indent=2)
+
+
+# Process-wide registry shared by the crawler, devices, connections and parser
+timings = TimingRegistry()
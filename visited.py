@@ -0,0 +1,85 @@
+import hashlib
+import math
+import threading
+from typing import Iterable
+import logging
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings"""
+
+    def __init__(self, expected_items: int = 100000, false_positive_rate: float = 0.01):
+        expected_items = max(expected_items, 1)
+        self.size = max(int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / expected_items * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Double hashing from a single digest gives hash_count independent positions
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class VisitedIndex:
+    """Thread-safe in-memory index of hostnames already visited or queued.
+
+    The exact set is authoritative for this process; the optional bloom
+    filter answers most "never seen" lookups without taking the lock.
+    """
+
+    def __init__(self, use_bloom: bool = False, expected_items: int = 100000):
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._expected_items = expected_items
+        self._bloom = BloomFilter(expected_items) if use_bloom else None
+        self.logger = logging.getLogger(__name__)
+
+    def load(self, hostnames: Iterable[str]):
+        """Warm the index with hostnames already recorded in the database"""
+        with self._lock:
+            for hostname in hostnames:
+                self._seen.add(hostname)
+                if self._bloom is not None:
+                    self._bloom.add(hostname)
+            self.logger.info(f"Loaded {len(self._seen)} known hostnames into visited index")
+
+    def add(self, hostname: str) -> bool:
+        """Record a hostname, returns False if it was already in the index"""
+        with self._lock:
+            if hostname in self._seen:
+                return False
+            self._seen.add(hostname)
+            if self._bloom is not None:
+                self._bloom.add(hostname)
+            return True
+
+    def clear(self):
+        """Forget every hostname in the index"""
+        with self._lock:
+            self._seen.clear()
+            if self._bloom is not None:
+                self._bloom = BloomFilter(self._expected_items)
+
+    def __contains__(self, hostname: str) -> bool:
+        # The bloom check runs without the lock: bits are only ever set, each byte read is atomic,
+        # and clear() swaps in a new filter rather than resetting this one. A miss can therefore
+        # only race with an add() of the same hostname, which answers as if the lookup came first,
+        # and add() stays the atomic gate for queueing.
+        bloom = self._bloom
+        if bloom is not None and hostname not in bloom:
+            return False
+        with self._lock:
+            return hostname in self._seen
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._seen)